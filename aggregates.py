@@ -0,0 +1,171 @@
+import os
+import threading
+import pandas as pd
+from data_store import DATE_COLUMN, DEFAULT_REGION, get_store
+from instrumentation import timed
+
+CACHE_PATH = './assets/data/cache'
+DAILY_COLUMNS = ['imputed_total_cases', 'imputed_total_deaths', 'totalVaccinations']
+BOX_PLOTS = [
+    ('stringency_index', 'imputed_total_cases'),
+    ('stringency_index', 'imputed_total_deaths'),
+    ('reproduction_rate', 'imputed_total_deaths'),
+]
+
+
+def daily_totals(df, columns=DAILY_COLUMNS):
+    """
+    Sum the given columns per date.
+
+    Parameters:
+    df (pd.DataFrame): A frame indexed by date.
+
+    Returns:
+    pd.DataFrame: One row per date with the summed columns.
+    """
+    return df.groupby(level=DATE_COLUMN)[columns].sum()
+
+def box_stats(df, group_column, value_column):
+    """
+    Compute the statistics Plotly needs to draw one box per group, matching its default
+    linear quartiles and whiskers reaching the furthest point within 1.5 IQR.
+
+    Returns:
+    tuple: A frame of q1, median, q3, lowerfence and upperfence indexed by group,
+           and a frame of the (group, value) outlier points beyond the whiskers.
+    """
+    grouped = df.groupby(group_column)[value_column]
+    stats = pd.DataFrame({
+        'q1': grouped.quantile(0.25),
+        'median': grouped.median(),
+        'q3': grouped.quantile(0.75),
+    })
+    iqr = stats['q3'] - stats['q1']
+    low = df[group_column].map(stats['q1'] - 1.5 * iqr)
+    high = df[group_column].map(stats['q3'] + 1.5 * iqr)
+    inside = df[value_column].between(low, high)
+
+    whiskers = df[inside].groupby(group_column)[value_column]
+    stats['lowerfence'] = whiskers.min()
+    stats['upperfence'] = whiskers.max()
+    outliers = df.loc[~inside, [group_column, value_column]].reset_index(drop=True)
+    return stats, outliers
+
+
+class AggregateCache:
+    """
+    Materialized group-bys for the EDA charts, computed once per version of the source
+    data and kept both in memory and as Parquet files keyed by the store's content hash.
+
+    When rows have been appended to the store since an earlier version whose aggregates
+    are on disk, those are updated with the new rows instead of being recomputed.
+
+    Parameters:
+    store (DataStore): The store the aggregates are computed from.
+    cache_path (str): Root directory for the on-disk aggregates.
+    """
+
+    def __init__(self, store, cache_path=CACHE_PATH):
+        self.store = store
+        self.content_hash = store.content_hash
+        self.cache_path = cache_path
+        self.directory = os.path.join(cache_path, self.content_hash[:16])
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name, compute):
+        frame = self._frames.get(name)
+        if frame is not None:
+            return frame
+        with self._lock:
+            frame = self._frames.get(name)
+            if frame is None:
+                path = os.path.join(self.directory, f'{name}.parquet')
+                if os.path.exists(path):
+                    with timed('aggregate_load'):
+                        frame = pd.read_parquet(path)
+                else:
+                    with timed('aggregate_compute'):
+                        frame = compute()
+                    os.makedirs(self.directory, exist_ok=True)
+                    temporary = f'{path}.{os.getpid()}.tmp'
+                    frame.to_parquet(temporary)
+                    os.replace(temporary, path)
+                self._frames[name] = frame
+        return frame
+
+    def _previous(self, *names):
+        """
+        Find the latest earlier version of the store with the named aggregates on disk.
+
+        Returns:
+        tuple: Its content hash and the frames, or (None, None) if there is none.
+        """
+        for revision in reversed(self.store.revisions[:-1]):
+            paths = [os.path.join(self.cache_path, revision[:16], f'{name}.parquet') for name in names]
+            if all(os.path.exists(path) for path in paths):
+                return revision, [pd.read_parquet(path) for path in paths]
+        return None, None
+
+    def _daily_totals(self):
+        revision, previous = self._previous('daily_totals')
+        if revision is None:
+            return daily_totals(self.store.frame(DAILY_COLUMNS))
+        # Appended rows are dated after every earlier row, so their totals are new rows.
+        return pd.concat([previous[0], daily_totals(self.store.rows_since(revision, DAILY_COLUMNS))])
+
+    def _box(self, name, group_column, value_column):
+        revision, previous = self._previous(name, name + '_outliers')
+        frame = self.store.frame([group_column, value_column])
+        if revision is None:
+            return box_stats(frame, group_column, value_column)
+
+        # Only the groups that received new rows are recomputed.
+        stats, outliers = previous
+        touched = self.store.rows_since(revision, [group_column])[group_column].unique()
+        changed_stats, changed_outliers = box_stats(frame[frame[group_column].isin(touched)], group_column, value_column)
+        stats = pd.concat([stats.drop(touched, errors='ignore'), changed_stats]).sort_index()
+        outliers = pd.concat([outliers[~outliers[group_column].isin(touched)], changed_outliers], ignore_index=True)
+        return stats, outliers
+
+    def daily_totals(self):
+        return self._get('daily_totals', self._daily_totals)
+
+    def box(self, group_column, value_column):
+        """
+        Return the (stats, outliers) frames for a box plot of value_column by group_column.
+        """
+        name = f'box_{group_column}_{value_column}'
+        computed = {}
+
+        def compute(part):
+            if not computed:
+                computed['stats'], computed['outliers'] = self._box(name, group_column, value_column)
+            return computed[part]
+
+        stats = self._get(name, lambda: compute('stats'))
+        outliers = self._get(name + '_outliers', lambda: compute('outliers'))
+        return stats, outliers
+
+    def warm(self):
+        """
+        Compute every aggregate the EDA page uses.
+        """
+        self.daily_totals()
+        for group_column, value_column in BOX_PLOTS:
+            self.box(group_column, value_column)
+
+
+_aggregates = {}
+_aggregates_lock = threading.Lock()
+
+def get_aggregates(region=DEFAULT_REGION):
+    """
+    Return the process-wide AggregateCache of a region for its current data version.
+    """
+    store = get_store(region)
+    with _aggregates_lock:
+        aggregates = _aggregates.get(region)
+        if aggregates is None or aggregates.content_hash != store.content_hash:
+            aggregates = _aggregates[region] = AggregateCache(store)
+        return aggregates
@@ -0,0 +1,225 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from data_store import DEFAULT_REGION
+from feature_pipeline import PIPELINES, get_pipeline
+from model_registry import ModelRegistry
+from prediction_cache import PredictionCache, cached_predict
+from explanations import BIAS_COLUMN, cached_contributions, contributions
+from prediction_intervals import interval_bounds, load_calibration
+from region_scoring import REGION_COLUMN, RegionScorer
+
+DEFAULT_CHUNKSIZE = 100_000
+
+
+class BatchPredictor:
+    """
+    Score whole tables with the XGBoost models, loading each model only once.
+
+    Parameters:
+    models (iterable of str): Names of the models to load, keys of feature_pipeline.PIPELINES.
+    nthread (int): Number of threads XGBoost uses per prediction call, -1 for all cores.
+    registry (ModelRegistry, optional): Registry to take the models from instead of a private one.
+    cache (PredictionCache, optional): Cache repeated feature vectors are scored through.
+    processes (int, optional): Worker processes for inputs with a region column, each row
+                               being scored with its region's model; the number of cores by default.
+    intervals (bool): Also add the prediction interval around each prediction, one column per quantile.
+    explain (bool): Also add each feature's contribution to the prediction, one column per feature
+                    and one for the bias. The predictions then come from the same call, as the
+                    sum of the contributions.
+    """
+
+    def __init__(self, models=('cases', 'deaths'), nthread=-1, registry=None, cache=None, processes=None, intervals=False,
+                 explain=False):
+        registry = registry or ModelRegistry(nthread=nthread)
+        for name in models if intervals else ():
+            if load_calibration(registry.get(name)) is None:
+                raise FileNotFoundError(f"No prediction intervals calibrated for the served '{name}' model, "
+                                        f"calibrate them with: python prediction_intervals.py calibrate")
+        self.registry = registry
+        self.intervals = intervals
+        self.pipelines = {name: get_pipeline(name) for name in models}
+        self.models = {name: registry.get(name) for name in models}
+        self.boosters = {name: model.booster for name, model in self.models.items()}
+        self.cache = cache
+        self.explain = explain
+        self.processes = processes
+        self._scorer = None
+
+    def features(self, name):
+        return self.pipelines[name].features
+
+    def predict_frame(self, name, dataframe):
+        """
+        Score every row of a DataFrame with one DMatrix and one predict call.
+
+        Parameters:
+        name (str): The model name.
+        dataframe (pd.DataFrame): Raw user-scale features, one scenario per row.
+
+        Returns:
+        np.ndarray: One prediction per input row.
+        """
+        matrix = self.pipelines[name].transform(dataframe)
+        if self.cache is not None:
+            return cached_predict(self.models[name], matrix, self.cache)
+        dmatrix = xgb.DMatrix(matrix, feature_names=self.features(name))
+        return self.boosters[name].predict(dmatrix)
+
+    def predict_regions(self, name, dataframe):
+        """
+        Score a DataFrame with a region column, fanning the regions out over worker processes.
+        """
+        if self._scorer is None:
+            self._scorer = RegionScorer(self.processes)
+        return self._scorer.score_frame(name, dataframe)
+
+    def predict_intervals(self, name, dataframe, predictions):
+        """
+        Put the prediction interval of each row's region around its prediction.
+
+        Returns:
+        pd.DataFrame: One column per quantile, in input order.
+        """
+        frames = []
+        for region, positions in _region_groups(dataframe).items():
+            intervals = interval_bounds(self.registry.get(name, region), predictions[positions], region)
+            frames.append(intervals.set_axis(positions))
+        return pd.concat(frames).sort_index()
+
+    def predict_contributions(self, name, dataframe):
+        """
+        Attribute the prediction of every row to the features with one call per region.
+
+        Returns:
+        pd.DataFrame: One column per feature and one for the bias, in input order.
+        """
+        frames = []
+        for region, positions in _region_groups(dataframe).items():
+            pipeline = get_pipeline(name, region)
+            model = self.registry.get(name, region)
+            matrix = pipeline.transform(dataframe.iloc[positions])
+            if self.cache is not None:
+                values = cached_contributions(model, matrix, self.cache)
+            else:
+                values = contributions(model, matrix)
+            frames.append(pd.DataFrame(values, index=positions, columns=pipeline.features + [BIAS_COLUMN]))
+        return pd.concat(frames).sort_index()
+
+    def predict_chunks(self, chunks):
+        for chunk in chunks:
+            chunk = chunk.copy()
+            for name in self.boosters:
+                output_column = self.pipelines[name].output_column
+                if self.explain:
+                    explained = self.predict_contributions(name, chunk)
+                    chunk[output_column] = explained.to_numpy().sum(axis=1, dtype=np.float32)
+                    for column, values in explained.items():
+                        chunk[f'{output_column}_contrib_{column}'] = values.to_numpy()
+                elif REGION_COLUMN in chunk.columns:
+                    chunk[output_column] = self.predict_regions(name, chunk)
+                else:
+                    chunk[output_column] = self.predict_frame(name, chunk)
+                if self.intervals:
+                    for column, values in self.predict_intervals(name, chunk, chunk[output_column].to_numpy()).items():
+                        chunk[f'{output_column}_{column}'] = values.to_numpy()
+            yield chunk
+
+    def close(self):
+        if self._scorer is not None:
+            self._scorer.close()
+
+    def predict_file(self, input_path, output_path, chunksize=DEFAULT_CHUNKSIZE):
+        """
+        Score a CSV or Parquet file chunk by chunk and write the rows with their predictions.
+
+        Parameters:
+        input_path (str): Path to a .csv or .parquet file of raw feature rows.
+        output_path (str): Path of the .csv or .parquet file to write.
+        chunksize (int): Number of rows scored per predict call.
+
+        Returns:
+        int: The number of rows written.
+        """
+        rows = 0
+        writer = None
+        output_is_parquet = _is_parquet(output_path)
+        try:
+            for chunk in self.predict_chunks(read_chunks(input_path, chunksize)):
+                if output_is_parquet:
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(output_path, table.schema)
+                    writer.write_table(table)
+                else:
+                    chunk.to_csv(output_path, mode='w' if rows == 0 else 'a', header=rows == 0, index=False)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+
+
+def _region_groups(dataframe):
+    if REGION_COLUMN in dataframe.columns:
+        return dataframe.groupby(REGION_COLUMN, sort=False).indices
+    return {DEFAULT_REGION: np.arange(len(dataframe))}
+
+
+def _is_parquet(path):
+    return os.path.splitext(path)[1].lower() in ('.parquet', '.pq')
+
+
+def read_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Iterate over a CSV or Parquet file in DataFrame chunks of at most chunksize rows.
+    """
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+
+def predict_file(input_path, output_path, models=('cases', 'deaths'), chunksize=DEFAULT_CHUNKSIZE, nthread=-1, cache=None,
+                 processes=None, intervals=False, explain=False):
+    predictor = BatchPredictor(models, nthread=nthread, cache=cache, processes=processes, intervals=intervals,
+                               explain=explain)
+    try:
+        return predictor.predict_file(input_path, output_path, chunksize=chunksize)
+    finally:
+        predictor.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score a CSV or Parquet file of scenarios with the COVID-19 XGBoost models.')
+    parser.add_argument('input', help='Input .csv or .parquet file with one scenario per row')
+    parser.add_argument('output', help='Output .csv or .parquet file with the prediction columns appended')
+    parser.add_argument('--model', action='append', choices=sorted(PIPELINES),
+                        help='Model to score, may be repeated (default: all models)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help='Rows scored per predict call')
+    parser.add_argument('--nthread', type=int, default=-1, help='XGBoost threads, -1 for all cores')
+    parser.add_argument('--cache', action='store_true', help='Score repeated scenarios only once')
+    parser.add_argument('--processes', type=int, default=None,
+                        help=f"Worker processes when the input has a '{REGION_COLUMN}' column, the number of cores by default")
+    parser.add_argument('--intervals', action='store_true', help='Add prediction interval columns around the predictions')
+    parser.add_argument('--explain', action='store_true',
+                        help='Add the contribution of each feature to the predictions, see explanations.py')
+    args = parser.parse_args(argv)
+
+    models = args.model or list(PIPELINES)
+    cache = PredictionCache(ttl=None) if args.cache else None
+    rows = predict_file(args.input, args.output, models=models, chunksize=args.chunksize, nthread=args.nthread, cache=cache,
+                        processes=args.processes, intervals=args.intervals, explain=args.explain)
+    print(f"Wrote {rows} rows to {args.output}")
+    if cache is not None:
+        print(f"Cache: {cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
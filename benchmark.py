@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+
+SIZES = (1, 1_000, 1_000_000)
+QUICK_SIZES = (1, 1_000, 100_000)
+REPEAT = 5
+QUICK_REPEAT = 3
+REGRESSION_THRESHOLD = 1.2
+
+
+def measure(func, repeat=REPEAT):
+    """
+    Time a callable: each of the repeats runs it as many times as fit in about
+    0.2 s (at least once) and reports the mean time per call.
+
+    Returns:
+    dict: The median and min seconds per call, and the calls per repeat.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = [total / number for total in timer.repeat(repeat, number)]
+    return {'median': float(np.median(times)), 'min': float(min(times)), 'number': number, 'repeat': repeat}
+
+class Runner:
+    """
+    Collects results and prints one line per benchmark as it finishes.
+    """
+
+    def __init__(self, repeat=REPEAT, pattern=None):
+        self.repeat = repeat
+        self.pattern = pattern
+        self.results = {}
+
+    def run(self, name, func, rows=None):
+        if self.pattern and self.pattern not in name:
+            return
+        result = measure(func, self.repeat)
+        if rows is not None:
+            result['rows'] = rows
+            result['rows_per_second'] = rows / result['median']
+        self.results[name] = result
+        print(f"{name:<50} {result['median'] * 1000:>12.3f} ms", flush=True)
+
+
+def bench_model_load(runner):
+    from feature_pipeline import PIPELINES
+    from model_registry import load_booster
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, pipeline in PIPELINES.items():
+            native = os.path.join(directory, f'{name}.ubj')
+            load_booster(pipeline.model_path).save_model(native)
+            runner.run(f'model_load/{name}/pickle', lambda: load_booster(pipeline.model_path))
+            runner.run(f'model_load/{name}/ubj', lambda: load_booster(native))
+
+def bench_predict(runner, sizes):
+    from compact_model import CompactForest
+    from explanations import contributions
+    from feature_pipeline import PIPELINES, random_inputs
+    from model_registry import get_model
+    from prediction_intervals import interval_bounds, load_calibration
+
+    for name, pipeline in PIPELINES.items():
+        model = get_model(name)
+        compact = CompactForest.from_booster(model.booster)
+        intervals = load_calibration(model) is not None
+        for rows in sizes:
+            matrix = pipeline.transform(random_inputs(pipeline, rows))
+            runner.run(f'predict/{name}/{rows}', lambda: model.predict(matrix), rows)
+            runner.run(f'predict/{name}/{rows}/booster', lambda: model.booster.inplace_predict(matrix), rows)
+            if rows <= 1_000:
+                runner.run(f'predict/{name}/{rows}/compact', lambda: compact.predict(matrix), rows)
+                runner.run(f'predict/{name}/{rows}/contributions', lambda: contributions(model, matrix), rows)
+            if intervals:
+                runner.run(f'predict/{name}/{rows}/intervals', lambda: interval_bounds(model, model.predict(matrix)), rows)
+
+def bench_preprocessing(runner, sizes):
+    from feature_pipeline import get_pipeline, random_inputs
+    from preprocessing import preprocess_differencing, preprocess_log
+
+    pipeline = get_pipeline('deaths')
+    last_known = dict(zip(pipeline.differenced_features, pipeline.differenced_values))
+    log_feature, = pipeline.log_feature
+    for rows in sizes:
+        inputs = random_inputs(pipeline, rows)
+
+        def dataframe_path():
+            frame = preprocess_differencing(inputs, last_known)
+            frame[log_feature] = preprocess_log(frame[log_feature], pipeline.log_values[0])
+            return frame
+
+        runner.run(f'preprocess/dataframe/{rows}', dataframe_path, rows)
+        runner.run(f'preprocess/pipeline/{rows}', lambda: pipeline.transform(inputs), rows)
+
+def bench_data_load(runner):
+    from data_store import DataStore, read_source_csv
+
+    store = DataStore()
+    runner.run('data_load/csv', read_source_csv)
+    runner.run('data_load/parquet', lambda: store._read(store.columns))
+    runner.run('data_load/snapshot', lambda: DataStore().frame())
+
+def bench_figures(runner):
+    # The chart functions call st.plotly_chart, which outside a running app still
+    # serializes the figure, so these time building and marshalling each chart.
+    from streamlit.logger import set_log_level
+    from data_store import get_store
+    from aggregates import get_aggregates
+    import st_pages.eda_page as eda_page
+    import st_pages.overview_page as overview_page
+
+    set_log_level('error')
+    df = get_store().frame().reset_index()
+    aggregates = get_aggregates()
+    aggregates.warm()
+    for plot in (overview_page.plot1, overview_page.plot2, overview_page.plot3):
+        runner.run(f'figure/overview/{plot.__name__}', lambda: plot(df))
+    for plot in (eda_page.plot_cases_analysis, eda_page.plot_deaths_analysis, eda_page.plot_vaccinations_analysis,
+                 eda_page.cases_by_stringency_index, eda_page.total_deaths_by_stringency_index,
+                 eda_page.deaths_by_reproduction_rate):
+        runner.run(f'figure/eda/{plot.__name__}', lambda: plot(aggregates))
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_all(quick=False, pattern=None):
+    """
+    Run every benchmark group.
+
+    Parameters:
+    quick (bool): Fewer repeats and at most 100k rows.
+    pattern (str, optional): Only run benchmarks whose name contains it.
+
+    Returns:
+    dict: Metadata about the run and one result per benchmark.
+    """
+    import xgboost as xgb
+
+    runner = Runner(QUICK_REPEAT if quick else REPEAT, pattern)
+    sizes = QUICK_SIZES if quick else SIZES
+    bench_model_load(runner)
+    bench_predict(runner, sizes)
+    bench_preprocessing(runner, sizes)
+    bench_data_load(runner)
+    bench_figures(runner)
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'xgboost': xgb.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'quick': quick,
+        },
+        'results': runner.results,
+    }
+
+def compare(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Print the median time of each benchmark against a baseline run.
+
+    Returns:
+    list: Names of the benchmarks more than threshold times slower than the baseline.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<50} {'baseline ms':>12} {'current ms':>12} {'ratio':>8}")
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f"{name:<50} {'-':>12} {result['median'] * 1000:>12.3f} {'new':>8}")
+            continue
+        ratio = result['median'] / before['median']
+        flag = ' !' if ratio > threshold else ''
+        if flag:
+            regressions.append(name)
+        print(f"{name:<50} {before['median'] * 1000:>12.3f} {result['median'] * 1000:>12.3f} {ratio:>7.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark model loading, prediction, preprocessing, data loading and charts.')
+    parser.add_argument('--output', help='JSON file to save the results to')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='Slowdown ratio reported as a regression')
+    parser.add_argument('--filter', help='Only run benchmarks whose name contains this')
+    parser.add_argument('--quick', action='store_true', help='Fewer repeats and at most 100k rows')
+    args = parser.parse_args(argv)
+
+    results = run_all(args.quick, args.filter)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.2f}x: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
+from feature_pipeline import PIPELINES, get_pipeline, random_inputs
+
+COMPACT_EXTENSION = '.npz'
+# Rows per chunk are chosen so that a chunk's (rows, trees) node matrix stays around 4M entries.
+CHUNK_NODES = 1 << 22
+PARITY_ROWS = 10_000
+PARITY_TOLERANCE = 1e-5
+
+
+def _tree_depth(left, right):
+    depth = np.zeros(len(left), dtype=np.int32)
+    for node in range(len(left)):
+        if left[node] != -1:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+class CompactForest:
+    """
+    The trees of an XGBoost regression model flattened into a handful of NumPy arrays,
+    scored by walking every row down every tree at once, one level per step.
+
+    Leaves point to themselves and hold their value in threshold, so after depth steps
+    every row sits on a leaf. The arrays take a fraction of the memory of a Booster and
+    a single row is scored several times faster, XGBoost's per-call overhead dominating
+    at that size; for larger batches the Booster is faster.
+
+    Parameters:
+    left, right (np.ndarray): Child node of each node, for values below and from the threshold.
+    feature (np.ndarray): Feature column each node splits on.
+    threshold (np.ndarray): Split value of each node, the leaf value for leaves.
+    default_left (np.ndarray): Whether a missing value goes to the left child.
+    roots (np.ndarray): Root node of each tree.
+    base_score (float): The model's base score, added to the sum of the leaves.
+    depth (int): Depth of the deepest tree.
+    source (str, optional): The content_version of the model the trees were exported from.
+    """
+
+    def __init__(self, left, right, feature, threshold, default_left, roots, base_score, depth, source=None):
+        self.left = left
+        self.right = right
+        self.feature = feature
+        self.threshold = threshold
+        self.default_left = default_left
+        self.roots = roots
+        self.base_score = np.float32(base_score)
+        self.depth = int(depth)
+        self.source = source
+
+    @classmethod
+    def from_booster(cls, booster):
+        """
+        Flatten a Booster. Only single-output gbtree models with the identity link
+        (reg:squarederror) and numerical splits are supported.
+        """
+        model = json.loads(booster.save_raw('json'))['learner']
+        objective = model['objective']['name']
+        if model['gradient_booster']['name'] != 'gbtree' or objective != 'reg:squarederror':
+            raise ValueError(f"Unsupported model: {model['gradient_booster']['name']} with {objective}")
+
+        left, right, feature, threshold, default_left, roots = [], [], [], [], [], []
+        offset = 0
+        depth = 0
+        for tree in model['gradient_booster']['model']['trees']:
+            if any(tree['split_type']):
+                raise ValueError('Categorical splits are not supported')
+            tree_left = np.array(tree['left_children'], dtype=np.int32)
+            tree_right = np.array(tree['right_children'], dtype=np.int32)
+            leaf = tree_left == -1
+            nodes = np.arange(len(tree_left), dtype=np.int32)
+            left.append(np.where(leaf, nodes, tree_left) + offset)
+            right.append(np.where(leaf, nodes, tree_right) + offset)
+            feature.append(np.where(leaf, 0, tree['split_indices']).astype(np.int32))
+            threshold.append(np.array(tree['split_conditions'], dtype=np.float32))
+            default_left.append(np.array(tree['default_left'], dtype=bool))
+            roots.append(offset)
+            depth = max(depth, _tree_depth(tree_left, tree_right))
+            offset += len(tree_left)
+
+        base_score = float(model['learner_model_param']['base_score'].strip('[]'))
+        return cls(np.concatenate(left), np.concatenate(right), np.concatenate(feature), np.concatenate(threshold),
+                   np.concatenate(default_left), np.array(roots, dtype=np.int32), base_score, depth,
+                   content_version(booster.save_raw('ubj')))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            source = str(arrays['source']) if 'source' in arrays.files else None
+            return cls(arrays['left'], arrays['right'], arrays['feature'], arrays['threshold'],
+                       arrays['default_left'], arrays['roots'], arrays['base_score'], arrays['depth'], source)
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            np.savez(file, left=self.left, right=self.right, feature=self.feature, threshold=self.threshold,
+                     default_left=self.default_left, roots=self.roots, base_score=self.base_score, depth=self.depth,
+                     source=np.str_(self.source or ''))
+
+    def predict(self, matrix):
+        """
+        Score a preprocessed matrix, missing values marked as NaN.
+
+        Returns:
+        np.ndarray: One float32 prediction per row.
+        """
+        matrix = np.asarray(matrix, dtype=np.float32)
+        chunk_rows = max(1, CHUNK_NODES // len(self.roots))
+        return np.concatenate([self._predict_chunk(matrix[start:start + chunk_rows])
+                               for start in range(0, len(matrix), chunk_rows)] or [np.empty(0, dtype=np.float32)])
+
+    def _predict_chunk(self, matrix):
+        rows = np.arange(len(matrix))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(matrix), len(self.roots)))
+        for _ in range(self.depth):
+            values = matrix[rows, self.feature[nodes]]
+            go_left = np.where(np.isnan(values), self.default_left[nodes], values < self.threshold[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        # Accumulated in tree order starting from the base score, as XGBoost does, for identical float32 results.
+        leaves = np.column_stack([np.full(len(matrix), self.base_score, dtype=np.float32), self.threshold[nodes]])
+        return np.cumsum(leaves, axis=1, dtype=np.float32)[:, -1]
+
+
+def content_version(data):
+    """
+    A short content hash of a model file, or of a Booster's UBJSON bytes, which are
+    the bytes Booster.save_model writes to a .ubj file.
+    """
+    return hashlib.sha1(data).hexdigest()[:12]
+
+def compact_path(model_path):
+    return os.path.splitext(model_path)[0] + COMPACT_EXTENSION
+
+def export_model(name):
+    """
+    Export the pickled model for name as XGBoost UBJSON and as a CompactForest, next to
+    the pickle. The registry serves from these files from the next lookup on.
+
+    Returns:
+    tuple: The paths of the UBJSON and compact files.
+    """
+    from model_registry import load_booster, native_path
+    model_path = get_pipeline(name).model_path
+    booster = load_booster(model_path)
+    ubj_path = native_path(model_path, '.ubj')
+    booster.save_model(ubj_path)
+    CompactForest.from_booster(booster).save(compact_path(model_path))
+    return ubj_path, compact_path(model_path)
+
+def parity_inputs(name, rows=PARITY_ROWS, seed=0):
+    """
+    Preprocessed inputs around the pipeline's defaults, with about 5% of the values
+    missing so that the default directions of the splits are exercised too.
+    """
+    pipeline = get_pipeline(name)
+    matrix = pipeline.transform(random_inputs(pipeline, rows, seed))
+    rng = np.random.default_rng(seed)
+    matrix[rng.random(matrix.shape) < 0.05] = np.nan
+    return matrix
+
+def check_parity(name, rows=PARITY_ROWS):
+    """
+    Compare the exported UBJSON and compact models against the pickled one.
+
+    Returns:
+    dict: The largest relative difference of each exported format from the pickle.
+    """
+    from model_registry import load_booster, native_path
+    model_path = get_pipeline(name).model_path
+    matrix = parity_inputs(name, rows)
+    expected = load_booster(model_path).inplace_predict(matrix)
+    scale = np.maximum(np.abs(expected), 1)
+    predictions = {
+        'ubj': load_booster(native_path(model_path, '.ubj')).inplace_predict(matrix),
+        'compact': CompactForest.load(compact_path(model_path)).predict(matrix),
+    }
+    return {fmt: float(np.max(np.abs(predicted - expected) / scale)) for fmt, predicted in predictions.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export the models in compact serving formats and check them against the pickles.')
+    parser.add_argument('command', choices=['export', 'check'])
+    parser.add_argument('--model', action='append', choices=list(PIPELINES), help='Model to process, repeatable (default: all)')
+    parser.add_argument('--rows', type=int, default=PARITY_ROWS, help='Rows scored by the parity check')
+    parser.add_argument('--tolerance', type=float, default=PARITY_TOLERANCE, help='Largest relative difference accepted')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for name in args.model or list(PIPELINES):
+        if args.command == 'export':
+            paths = export_model(name)
+            print(f"{name}: wrote {', '.join(paths)}")
+            continue
+        for fmt, difference in check_parity(name, args.rows).items():
+            ok = difference <= args.tolerance
+            failed = failed or not ok
+            print(f"{name} {fmt}: max relative difference {difference:.2e} {'ok' if ok else 'FAILED'}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
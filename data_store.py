@@ -0,0 +1,463 @@
+import os
+import json
+import time
+import fcntl
+import hashlib
+import threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from instrumentation import instrumented
+
+DATA_PATH = './assets/data/preprocessed_data_updated.csv'
+STORE_PATH = './assets/data/store'
+MANIFEST_FILE = 'manifest.json'
+# Held while the store is built or appended to, so that processes starting together build it once.
+LOCK_FILE = 'store.lock'
+# Memory-mapped copies of the store, one directory per revision, shared by all processes.
+SNAPSHOT_DIR = 'snapshots'
+SNAPSHOT_LAYOUT_FILE = 'layout.json'
+# Snapshots of older revisions are removed once unused for this long, so that processes
+# that have just read a layout, or are still on an older revision, do not lose their files.
+SNAPSHOT_GRACE_SECONDS = 600
+DATE_COLUMN = 'date'
+# The original series lives in DATA_PATH/STORE_PATH; every other region has a directory
+# under REGIONS_PATH holding its source CSV and its own store, with the same schema.
+DEFAULT_REGION = 'zambia'
+REGIONS_PATH = './assets/data/regions'
+REGION_SOURCE_FILE = 'data.csv'
+REGION_STORE_DIR = 'store'
+
+
+def list_regions():
+    """
+    Returns:
+    list of str: The default region followed by every region directory with a source CSV.
+    """
+    regions = []
+    if os.path.isdir(REGIONS_PATH):
+        regions = sorted(name for name in os.listdir(REGIONS_PATH)
+                         if os.path.isfile(os.path.join(REGIONS_PATH, name, REGION_SOURCE_FILE)))
+    return [DEFAULT_REGION] + [region for region in regions if region != DEFAULT_REGION]
+
+def region_paths(region=DEFAULT_REGION):
+    """
+    Returns:
+    tuple: The source CSV and store directory of a region.
+    """
+    if region == DEFAULT_REGION:
+        return DATA_PATH, STORE_PATH
+    directory = os.path.join(REGIONS_PATH, region)
+    if os.path.basename(os.path.normpath(directory)) != region or not os.path.isfile(os.path.join(directory, REGION_SOURCE_FILE)):
+        raise ValueError(f"Unknown region '{region}', expected one of {list_regions()}")
+    return os.path.join(directory, REGION_SOURCE_FILE), os.path.join(directory, REGION_STORE_DIR)
+
+
+@instrumented('csv_read')
+def read_source_csv(csv_path=DATA_PATH):
+    """
+    Parse the source CSV into a typed frame indexed by date.
+
+    The unnamed first column holds the dates; float columns are downcast to float32
+    wherever pandas can do so without changing the values beyond float32 precision.
+    """
+    df = pd.read_csv(csv_path, index_col=0, parse_dates=[0])
+    df.index.name = DATE_COLUMN
+    df = df.sort_index()
+    float_columns = df.select_dtypes('float').columns
+    df[float_columns] = df[float_columns].apply(pd.to_numeric, downcast='float')
+    return df
+
+def _source_stamp(csv_path):
+    stat = os.stat(csv_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _read_manifest(store_path):
+    try:
+        with open(os.path.join(store_path, MANIFEST_FILE)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def _manifest_stamp(store_path):
+    try:
+        stat = os.stat(os.path.join(store_path, MANIFEST_FILE))
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def _write_manifest(store_path, manifest):
+    path = os.path.join(store_path, MANIFEST_FILE)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temporary, path)
+
+def _write_part(df, store_path, part):
+    path = os.path.join(store_path, part)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    df.to_parquet(temporary, engine='pyarrow')
+    os.replace(temporary, path)
+    return path
+
+@contextmanager
+def store_lock(store_path):
+    """
+    Hold an exclusive lock on a store across processes while writing to it.
+    """
+    os.makedirs(store_path, exist_ok=True)
+    with open(os.path.join(store_path, LOCK_FILE), 'a') as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+def _revision(previous, part_hash):
+    """
+    The content hash of the store after appending a part: a hash chain over the
+    source CSV and every appended part, in order.
+    """
+    return hashlib.sha256(f'{previous}:{part_hash}'.encode()).hexdigest()
+
+def _part_dates(store_path, part):
+    return pq.read_table(os.path.join(store_path, part), columns=[DATE_COLUMN]).to_pandas().index
+
+def _kept_parts(store_path, manifest, columns, last_date):
+    """
+    The appended parts of an existing store that still follow a rebuilt base part:
+    same schema and dated strictly after its last row.
+    """
+    if manifest is None or 'revisions' not in manifest or manifest['columns'] != columns:
+        return []
+    kept = []
+    for part in manifest['parts'][1:]:
+        dates = _part_dates(store_path, part)
+        if len(dates) and dates[0] > last_date:
+            kept.append(part)
+    return kept
+
+@instrumented('store_build')
+def build_store(csv_path=DATA_PATH, store_path=STORE_PATH):
+    """
+    Convert the source CSV into the columnar store: one Parquet part plus a manifest
+    recording the schema and the source file it was built from. Parts appended by
+    ingestion are kept when they are dated after the CSV's last row. The caller holds
+    the store_lock, as ensure_store does.
+
+    Returns:
+    dict: The manifest of the new store.
+    """
+    df = read_source_csv(csv_path)
+    columns = {column: str(dtype) for column, dtype in df.dtypes.items()}
+    os.makedirs(store_path, exist_ok=True)
+    previous = _read_manifest(store_path)
+    kept = _kept_parts(store_path, previous, columns, df.index[-1])
+
+    part = 'part-00000.parquet'
+    _write_part(df, store_path, part)
+    source_hash = file_hash(csv_path)
+    revisions = [source_hash]
+    for name in kept:
+        revisions.append(_revision(revisions[-1], file_hash(os.path.join(store_path, name))))
+    manifest = {
+        'source': os.path.abspath(csv_path),
+        'source_stamp': _source_stamp(csv_path),
+        'source_hash': source_hash,
+        'columns': columns,
+        'parts': [part] + kept,
+        'revisions': revisions,
+        'rows': len(df) + sum(len(_part_dates(store_path, name)) for name in kept),
+        'last_date': (_part_dates(store_path, kept[-1])[-1] if kept else df.index[-1]).isoformat(),
+        'ingested': {source: name for source, name in (previous or {}).get('ingested', {}).items()
+                     if name is None or name in kept},
+    }
+    _write_manifest(store_path, manifest)
+    # Dropped parts go only once the new manifest no longer lists them.
+    for name in os.listdir(store_path):
+        if name.endswith('.parquet') and name not in manifest['parts']:
+            os.remove(os.path.join(store_path, name))
+    return manifest
+
+def append_part(df, store_path=STORE_PATH, source_hash=None):
+    """
+    Append rows to the store as a new Parquet part without touching the existing ones.
+    The store is append-only: every row must be dated after the store's last row.
+
+    Parameters:
+    df (pd.DataFrame): Rows indexed by date with the store's columns and dtypes.
+    store_path (str): Directory holding the Parquet parts and manifest.
+    source_hash (str, optional): Hash of the file the rows came from, recorded so the
+                                 same file is never ingested twice; recorded even if df is empty.
+
+    Returns:
+    dict: The manifest of the updated store.
+    """
+    with store_lock(store_path):
+        return _append_part(df, store_path, source_hash)
+
+def _append_part(df, store_path, source_hash):
+    manifest = _read_manifest(store_path)
+    if manifest is None or 'revisions' not in manifest:
+        raise FileNotFoundError(f"No store to append to in {store_path}")
+    if list(df.columns) != list(manifest['columns']):
+        raise ValueError("Appended rows must have the store's columns, in order")
+    if len(df) and df.index[0] <= pd.Timestamp(manifest['last_date']):
+        raise ValueError(f"Appended rows must be dated after {manifest['last_date']}")
+
+    part = None
+    if len(df):
+        part = f"part-{max(int(name[5:10]) for name in manifest['parts']) + 1:05d}.parquet"
+        path = _write_part(df.rename_axis(DATE_COLUMN), store_path, part)
+        manifest['parts'].append(part)
+        manifest['revisions'].append(_revision(manifest['revisions'][-1], file_hash(path)))
+        manifest['rows'] += len(df)
+        manifest['last_date'] = df.index[-1].isoformat()
+    if source_hash is not None:
+        manifest['ingested'][source_hash] = part
+    _write_manifest(store_path, manifest)
+    return manifest
+
+def ensure_store(csv_path=DATA_PATH, store_path=STORE_PATH):
+    """
+    Return the store manifest, (re)building the store if it is missing or older than the CSV.
+    Processes finding it so at the same time build it once: the others wait for the lock
+    and find it current.
+    """
+    manifest = _read_manifest(store_path)
+    if _is_current(manifest, csv_path):
+        return manifest
+    with store_lock(store_path):
+        manifest = _read_manifest(store_path)
+        if not _is_current(manifest, csv_path):
+            manifest = build_store(csv_path, store_path)
+    return manifest
+
+def _is_current(manifest, csv_path):
+    return manifest is not None and 'revisions' in manifest and (
+        not os.path.exists(csv_path) or manifest['source_stamp'] == _source_stamp(csv_path))
+
+
+def _snapshot_path(store_path, content_hash):
+    return os.path.join(store_path, SNAPSHOT_DIR, content_hash[:16])
+
+def _remove_tree(path):
+    for name in os.listdir(path):
+        os.remove(os.path.join(path, name))
+    os.rmdir(path)
+
+def write_snapshot(df, path):
+    """
+    Write a frame as memory-mappable NumPy files: the dates, and per dtype one
+    column-major matrix, so that each column is a contiguous slice of a file.
+
+    The snapshot is written to a temporary directory and renamed into place, so
+    processes racing to write the same snapshot never see a partial one.
+    """
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp = os.path.join(parent, f'.tmp-{os.getpid()}-{threading.get_ident()}')
+    os.makedirs(tmp, exist_ok=True)
+
+    layout = {}
+    for dtype in sorted({str(dtype) for dtype in df.dtypes}):
+        columns = [column for column in df.columns if str(df[column].dtype) == dtype]
+        np.save(os.path.join(tmp, f'{dtype}.npy'), np.asfortranarray(df[columns].to_numpy(dtype=dtype)))
+        layout.update({column: [dtype, position] for position, column in enumerate(columns)})
+    np.save(os.path.join(tmp, 'index.npy'), df.index.to_numpy())
+    with open(os.path.join(tmp, SNAPSHOT_LAYOUT_FILE), 'w') as file:
+        json.dump({'columns': layout}, file)
+
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # Another process got there first.
+        _remove_tree(tmp)
+
+def read_snapshot(path):
+    """
+    Map a snapshot read-only. Nothing is read until used, and the pages are shared
+    through the page cache with every other process mapping the same files.
+
+    Returns:
+    tuple or None: The DatetimeIndex and a dict of column name to a read-only array, or
+                   None if there is no such snapshot.
+    """
+    try:
+        with open(os.path.join(path, SNAPSHOT_LAYOUT_FILE)) as file:
+            layout = json.load(file)['columns']
+        matrices = {dtype: np.load(os.path.join(path, f'{dtype}.npy'), mmap_mode='r') for dtype, _ in layout.values()}
+        index = pd.DatetimeIndex(np.load(os.path.join(path, 'index.npy')), name=DATE_COLUMN)
+    except (OSError, ValueError):
+        # Missing, or removed while being opened.
+        return None
+    return index, {column: matrices[dtype][:, position] for column, (dtype, position) in layout.items()}
+
+def _remove_old_snapshots(store_path, keep, now=None):
+    """
+    Remove the snapshots of revisions before the previous one, as recorded in the manifest
+    on disk, once they have not been written for SNAPSHOT_GRACE_SECONDS. A process still on
+    an older manifest thus never removes a newer snapshot, and one that has just read a
+    layout finds its files. Processes mapping a removed snapshot keep their pages; the
+    files go once unmapped.
+    """
+    manifest = _read_manifest(store_path) or {}
+    kept = {keep} | {content_hash[:16] for content_hash in manifest.get('revisions', [])[-2:]}
+    now = time.time() if now is None else now
+    parent = os.path.join(store_path, SNAPSHOT_DIR)
+    for name in os.listdir(parent):
+        if name in kept or name.startswith('.'):
+            continue
+        path = os.path.join(parent, name)
+        try:
+            if now - os.stat(path).st_mtime > SNAPSHOT_GRACE_SECONDS:
+                _remove_tree(path)
+        except OSError:
+            pass
+
+
+class DataStore:
+    """
+    Read-only access to the columnar dataset, shared by every session and worker process.
+
+    Each revision of the store is written once as a snapshot of memory-mapped NumPy files,
+    by whichever process needs it first. All processes map the same files, so the data is
+    held once in the page cache however many workers and sessions use it, and frames and
+    date ranges are views on the mapping rather than copies.
+
+    Parameters:
+    store_path (str): Directory holding the Parquet parts and manifest.
+    csv_path (str): The source CSV the store is built from.
+    """
+
+    def __init__(self, store_path=STORE_PATH, csv_path=DATA_PATH):
+        self.store_path = store_path
+        self.csv_path = csv_path
+        self.manifest = ensure_store(csv_path, store_path)
+        # Taken after ensure_store, which may have rebuilt the store and rewritten the manifest.
+        self.manifest_stamp = _manifest_stamp(store_path)
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    @property
+    def columns(self):
+        return list(self.manifest['columns'])
+
+    @property
+    def version(self):
+        return self.content_hash[:16]
+
+    @property
+    def content_hash(self):
+        return self.manifest['revisions'][-1]
+
+    @property
+    def revisions(self):
+        return list(self.manifest['revisions'])
+
+    @property
+    def last_date(self):
+        return pd.Timestamp(self.manifest['last_date'])
+
+    def parts_since(self, content_hash):
+        """
+        Return the parts appended after the store had the given content hash,
+        or None if that is not an earlier state of this store.
+        """
+        revisions = self.manifest['revisions']
+        if content_hash not in revisions:
+            return None
+        return self.manifest['parts'][revisions.index(content_hash) + 1:]
+
+    def rows_since(self, content_hash, columns):
+        """
+        Return the rows appended after the store had the given content hash, read from
+        the new parts only, or None if that is not an earlier state of this store.
+        """
+        parts = self.parts_since(content_hash)
+        if parts is None:
+            return None
+        if not parts:
+            return pd.DataFrame({column: pd.Series(dtype=self.manifest['columns'][column]) for column in columns},
+                                index=pd.DatetimeIndex([], name=DATE_COLUMN))
+        return self._read([DATE_COLUMN] + list(columns), parts)
+
+    def last_known(self, columns):
+        """
+        Return the last non-missing value of each column, NaN for columns never filled.
+        """
+        return self._read([DATE_COLUMN] + list(columns))[list(columns)].ffill().iloc[-1]
+
+    @instrumented('store_read')
+    def _read(self, columns=None, parts=None):
+        parts = self.manifest['parts'] if parts is None else parts
+        paths = [os.path.join(self.store_path, part) for part in parts]
+        tables = [pq.read_table(path, columns=columns) for path in paths]
+        return pd.concat([table.to_pandas() for table in tables]) if len(tables) > 1 else tables[0].to_pandas()
+
+    @instrumented('snapshot_build')
+    def _build_snapshot(self, path):
+        write_snapshot(self._read(), path)
+        _remove_old_snapshots(self.store_path, os.path.basename(path))
+
+    def _attach(self):
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    path = _snapshot_path(self.store_path, self.content_hash)
+                    snapshot = read_snapshot(path)
+                    if snapshot is None:
+                        self._build_snapshot(path)
+                        snapshot = read_snapshot(path)
+                    self._snapshot = snapshot
+        return self._snapshot
+
+    @property
+    def index(self):
+        return self._attach()[0]
+
+    def column(self, name):
+        """
+        Return one column as a Series indexed by date.
+        """
+        return self.frame([name])[name]
+
+    def frame(self, columns=None):
+        """
+        Return the requested columns (all by default) as a DataFrame indexed by date.
+        The columns are read-only views on the shared snapshot; nothing is copied.
+        """
+        columns = self.columns if columns is None else list(columns)
+        unknown = [column for column in columns if column not in self.manifest['columns']]
+        if unknown:
+            raise KeyError(f"Unknown columns: {unknown}")
+        index, arrays = self._attach()
+        return pd.DataFrame({column: arrays[column] for column in columns}, index=index, copy=False)
+
+
+_stores = {}
+_store_lock = threading.RLock()
+
+def get_store(region=DEFAULT_REGION):
+    """
+    Return the process-wide DataStore of a region, shared by all pages and sessions.
+    Parts appended to the store after it was loaded are picked up on the next call.
+    """
+    store = _stores.get(region)
+    if store is None or store.manifest_stamp != _manifest_stamp(store.store_path):
+        with _store_lock:
+            if _stores.get(region) is store:
+                csv_path, store_path = region_paths(region)
+                updated = DataStore(store_path, csv_path)
+                if region != DEFAULT_REGION and list(updated.manifest['columns']) != list(get_store().manifest['columns']):
+                    raise ValueError(f"The data of region '{region}' does not have the shared schema")
+                _stores[region] = updated
+    return _stores[region]
@@ -0,0 +1,126 @@
+import numpy as np
+
+# A chart is a few hundred pixels wide; two points per pixel column keep lines visually exact.
+MAX_LINE_POINTS = 2000
+# Scatter markers span several pixels, so one point per 3x3 pixel cell is indistinguishable.
+SCATTER_GRID = (160, 100)
+
+
+def _as_float(values):
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return values.astype(np.float64)
+
+def lttb_indices(x, y, n_out):
+    """
+    Pick n_out points of a series with the Largest-Triangle-Three-Buckets algorithm.
+
+    Parameters:
+    x (array-like): Sorted x values (numbers or datetimes).
+    y (array-like): The y values.
+    n_out (int): Number of points to keep, at least 3.
+
+    Returns:
+    np.ndarray: Sorted positions of the kept points, always including the first and last.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = _as_float(x)
+    y = _as_float(y)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    selected = np.empty(n_out, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[stop:next_stop].mean()
+        next_y = y[stop:next_stop].mean()
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+def minmax_indices(y, n_out):
+    """
+    Keep the minimum and maximum of each of n_out // 2 equal buckets, which preserves
+    every peak and trough of the series.
+
+    Returns:
+    np.ndarray: Sorted, unique positions of the kept points.
+    """
+    n = len(y)
+    buckets = n_out // 2
+    if n_out >= n or buckets < 1:
+        return np.arange(n)
+    y = _as_float(y)
+    width = -(-n // buckets)
+    padded = np.full(buckets * width, np.nan)
+    padded[:n] = y
+    blocks = padded.reshape(buckets, width)
+    offsets = np.arange(buckets) * width
+    lows = offsets + np.nanargmin(blocks, axis=1)
+    highs = offsets + np.nanargmax(blocks, axis=1)
+    return np.unique(np.concatenate([[0, n - 1], lows, highs]))
+
+def grid_thin_indices(x, y, grid=SCATTER_GRID):
+    """
+    Keep one point per cell of a pixel-sized grid laid over the scatter's extent.
+
+    Returns:
+    np.ndarray: Sorted positions of the kept points.
+    """
+    x = _as_float(x)
+    y = _as_float(y)
+    if len(x) <= grid[0] * grid[1] // 4:
+        return np.arange(len(x))
+
+    def cells(values, count):
+        low, high = np.nanmin(values), np.nanmax(values)
+        if not high > low:
+            return np.zeros(len(values), dtype=np.int64)
+        return np.minimum(((values - low) / (high - low) * count).astype(np.int64), count - 1)
+
+    cell = cells(x, grid[0]) * grid[1] + cells(y, grid[1])
+    return np.sort(np.unique(cell, return_index=True)[1])
+
+def downsample_line(df, x, y, n_out=MAX_LINE_POINTS, method='lttb'):
+    """
+    Reduce a line chart's frame to at most about n_out rows.
+
+    Callers pass the rows of the currently selected range, so narrowing the range
+    brings back full resolution once it holds fewer than n_out rows.
+
+    Parameters:
+    df (pd.DataFrame): The rows to plot, sorted by x.
+    x (str): The x column.
+    y (str): The y column.
+    n_out (int): The target number of points.
+    method (str): 'lttb' or 'minmax'.
+
+    Returns:
+    pd.DataFrame: The kept rows, or df itself when it is already small enough.
+    """
+    if len(df) <= n_out:
+        return df
+    if method == 'minmax':
+        indices = minmax_indices(df[y].to_numpy(), n_out)
+    else:
+        indices = lttb_indices(df[x].to_numpy(), df[y].to_numpy(), n_out)
+    return df.iloc[indices]
+
+def downsample_scatter(df, x, y, grid=SCATTER_GRID):
+    """
+    Reduce a scatter plot's frame to one row per pixel-sized cell.
+    """
+    indices = grid_thin_indices(df[x].to_numpy(), df[y].to_numpy(), grid)
+    if len(indices) == len(df):
+        return df
+    return df.iloc[indices]
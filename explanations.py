@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from data_store import DEFAULT_REGION, get_store, list_regions
+from feature_pipeline import PIPELINES, get_pipeline
+from model_registry import get_model
+from prediction_cache import PredictionCache, normalize
+from aggregates import CACHE_PATH
+from instrumentation import increment, timed
+from training import training_data
+
+BIAS_COLUMN = 'bias'
+IMPORTANCE_PATH = os.path.join(CACHE_PATH, 'importance')
+
+contribution_cache = PredictionCache()
+
+
+def contributions(model, matrix):
+    """
+    Score a preprocessed matrix and attribute every prediction to the features in one
+    call: XGBoost's exact TreeSHAP values (pred_contribs), one column per feature plus
+    the bias, each row summing to the prediction.
+
+    Returns:
+    np.ndarray: A (N, features + 1) float32 array, the bias last.
+    """
+    increment('explained_rows', len(matrix))
+    with timed(f'explain_{model.name}'):
+        return model.booster.predict(xgb.DMatrix(matrix, feature_names=model.booster.feature_names), pred_contribs=True)
+
+def cached_contributions(model, matrix, cache=contribution_cache):
+    """
+    Like contributions, taking repeated rows from the cache and explaining only the
+    distinct misses, in one call. The keys differ from those of cached_predict, so one
+    cache can hold both.
+    """
+    rows = normalize(matrix)
+    keys = [(model.name, model.version, 'contributions', row.tobytes()) for row in rows]
+    cached = cache.get_many(keys)
+
+    missing = {}
+    for position, (key, value) in enumerate(zip(keys, cached)):
+        if value is None:
+            missing.setdefault(key, position)
+    misses = sum(value is None for value in cached)
+    increment('contribution_cache_hits', len(keys) - misses)
+    increment('contribution_cache_misses', misses)
+    if missing:
+        scored = dict(zip(missing, contributions(model, rows[list(missing.values())])))
+        cache.put_many(scored.items())
+        cached = [scored[key] if value is None else value for key, value in zip(keys, cached)]
+    return np.vstack(cached)
+
+def explain(name, data, region=DEFAULT_REGION, cache=contribution_cache):
+    """
+    Explain the predictions for raw inputs, as the model pages enter them.
+
+    Returns:
+    pd.DataFrame: One row per input row with each feature's contribution and the bias.
+    """
+    pipeline = get_pipeline(name, region)
+    values = cached_contributions(get_model(name, region), pipeline.transform(data), cache)
+    return pd.DataFrame(values, columns=pipeline.features + [BIAS_COLUMN])
+
+
+_importance = {}
+_importance_lock = threading.Lock()
+
+def global_importance(name, region=DEFAULT_REGION):
+    """
+    The mean absolute contribution of each feature over a region's history: how much
+    the model leans on each feature overall. It is computed once per model version and
+    store revision, and kept on disk so other processes and restarts reuse it.
+
+    Returns:
+    pd.Series: The importance per feature, largest first.
+    """
+    model = get_model(name, region)
+    key = f'{region}-{name}-{model.version}-{get_store(region).version}'
+    importance = _importance.get(key)
+    if importance is None:
+        with _importance_lock:
+            importance = _importance.get(key)
+            if importance is None:
+                importance = _importance[key] = _load_or_compute_importance(name, region, model, key)
+    return importance
+
+def _load_or_compute_importance(name, region, model, key):
+    path = os.path.join(IMPORTANCE_PATH, f'{key}.json')
+    try:
+        with open(path) as file:
+            values = json.load(file)
+    except (OSError, ValueError):
+        matrix, _ = training_data(name, region)
+        mean_abs = np.abs(contributions(model, matrix)[:, :-1]).mean(axis=0)
+        values = dict(zip(get_pipeline(name, region).features, mean_abs.tolist()))
+        os.makedirs(IMPORTANCE_PATH, exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(values, file, indent=2)
+        os.replace(temporary, path)
+    return pd.Series(values, name='mean_abs_contribution').sort_values(ascending=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute the global feature importance of the served models.')
+    parser.add_argument('--model', action='append', choices=list(PIPELINES), help='Model to summarize, repeatable (default: all)')
+    parser.add_argument('--region', default=DEFAULT_REGION, choices=list_regions(), help='Region whose model and history are used')
+    args = parser.parse_args(argv)
+
+    for name in args.model or list(PIPELINES):
+        print(f"{name}:")
+        print(global_importance(name, args.region).round(3).to_string())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
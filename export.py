@@ -0,0 +1,116 @@
+import gzip
+import tempfile
+import threading
+from collections import OrderedDict
+import pyarrow as pa
+import pyarrow.parquet as pq
+from data_store import DEFAULT_REGION, get_store
+from time_series import get_time_series
+from instrumentation import timed
+
+EXPORT_FORMATS = {
+    'csv': {'label': 'CSV', 'file_name': 'covid_data.csv', 'mime': 'text/csv'},
+    'csv.gz': {'label': 'CSV (gzip)', 'file_name': 'covid_data.csv.gz', 'mime': 'application/gzip'},
+    'parquet': {'label': 'Parquet', 'file_name': 'covid_data.parquet', 'mime': 'application/vnd.apache.parquet'},
+}
+CHUNK_ROWS = 50_000
+# Exports larger than this are spooled to a temporary file and not kept in the cache.
+MAX_CACHED_EXPORT_BYTES = 32 * 1024 * 1024
+MAX_CACHE_BYTES = 128 * 1024 * 1024
+
+
+def iter_csv_chunks(df, chunk_rows=CHUNK_ROWS):
+    """
+    Yield a frame as UTF-8 encoded CSV, chunk_rows rows at a time, header first.
+    """
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0).encode('utf-8')
+
+def write_export(df, fmt, file, chunk_rows=CHUNK_ROWS):
+    """
+    Stream a frame into a binary file object in the given export format.
+
+    Parameters:
+    df (pd.DataFrame): The rows to export, with the date as a regular column.
+    fmt (str): A key of EXPORT_FORMATS.
+    file (file-like): A writable binary file object.
+    chunk_rows (int): Rows encoded at a time, bounding the extra memory used.
+    """
+    if fmt == 'csv':
+        for chunk in iter_csv_chunks(df, chunk_rows):
+            file.write(chunk)
+    elif fmt == 'csv.gz':
+        with gzip.GzipFile(fileobj=file, mode='wb', compresslevel=6) as compressed:
+            for chunk in iter_csv_chunks(df, chunk_rows):
+                compressed.write(chunk)
+    elif fmt == 'parquet':
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        with pq.ParquetWriter(file, schema, compression='zstd') as writer:
+            for start in range(0, len(df), chunk_rows):
+                table = pa.Table.from_pandas(df.iloc[start:start + chunk_rows], schema=schema, preserve_index=False)
+                writer.write_table(table)
+    else:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of {sorted(EXPORT_FORMATS)}")
+
+
+class ExportCache:
+    """
+    An LRU cache of encoded exports bounded by their total size in bytes.
+    """
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+export_cache = ExportCache()
+
+def export_data(fmt, start_date=None, end_date=None, region=DEFAULT_REGION):
+    """
+    Encode a region's dataset, optionally limited to a date range, for download. Results are
+    cached per data version, range and format; exports too large to cache are spooled
+    to a temporary file instead of being held in memory.
+
+    Returns:
+    bytes or file-like: The encoded export, ready to be passed to st.download_button.
+    """
+    store = get_store(region)
+    series = get_time_series(region=region)
+    lo, hi = series.locate(start_date or series.start, end_date or series.end)
+    key = (store.content_hash, lo, hi, fmt)
+    data = export_cache.get(key)
+    if data is not None:
+        return data
+
+    df = store.frame().iloc[lo:hi].reset_index()
+    spooled = tempfile.SpooledTemporaryFile(max_size=MAX_CACHED_EXPORT_BYTES)
+    with timed(f'export_{fmt}'):
+        write_export(df, fmt, spooled)
+    if spooled.tell() > MAX_CACHED_EXPORT_BYTES:
+        spooled.seek(0)
+        return spooled
+
+    spooled.seek(0)
+    data = spooled.read()
+    spooled.close()
+    export_cache.put(key, data)
+    return data
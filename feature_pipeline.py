@@ -0,0 +1,252 @@
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+from preprocessing import transform_matrix
+from data_store import DEFAULT_REGION, region_paths
+
+# Written into each region's store by ingest.py with the last known values of newly ingested data.
+BASELINES_FILE = 'baselines.json'
+BASELINES_AS_OF = '2024-04-21'
+
+# Declarative description of the inputs each model expects. The differenced and log
+# features hold the last known values as on 21st April 2024, unless refreshed by ingestion.
+PIPELINE_SPECS = {
+    'cases': {
+        'label': 'Total Imputed Cases',
+        'model_path': 'assets/model/xgb_model_total_imputed_cases.pkl',
+        'output_column': 'predicted_total_imputed_cases',
+        'target_column': 'imputed_total_cases',
+        'features': [
+            'fullyVaccinated', 'new_deaths_smoothed', 'new_people_vaccinated_smoothed', 'new_vaccinations_smoothed',
+            'partiallyVaccinated', 'stringency_index', 'test24hours', 'totalTests', 'totalVaccinations',
+            'vaccinated24hours', 'rfh', 'r3h', 'month', 'day_of_week',
+        ],
+        'differenced_features': {
+            'fullyVaccinated': 9327654, 'partiallyVaccinated': 4663827, 'totalTests': 239937354,
+            'totalVaccinations': 9982068
+        },
+        'log_feature': {},
+    },
+    'deaths': {
+        'label': 'Total Deaths',
+        'model_path': 'assets/model/xgb_model_total_deaths.pkl',
+        'output_column': 'predicted_total_deaths',
+        'target_column': 'total_deaths',
+        'features': [
+            'imputed_active_cases', 'fullyVaccinated', 'new_vaccinations_smoothed', 'partiallyVaccinated',
+            'stringency_index', 'test24hours', 'totalVaccinations', 'total_tests_per_thousand', 'vaccinated24hours',
+            'positive_rate', 'rfh', 'r3h', 'day_of_week', 'month',
+        ],
+        'differenced_features': {
+            'fullyVaccinated': 9327654, 'partiallyVaccinated': 4663827, 'stringency_index': 13.89,
+            'totalVaccinations': 9982068
+        },
+        'log_feature': {'total_tests_per_thousand': 180},
+    },
+}
+
+
+class FeaturePipeline:
+    """
+    A compiled feature pipeline: the model's feature order plus the column positions and
+    last known values of its differenced and log features, resolved once up front.
+
+    Parameters:
+    name (str): The model name, a key of PIPELINE_SPECS.
+    label (str): Human readable name of the predicted quantity.
+    model_path (str): Path to the pickled XGBoost model.
+    output_column (str): Column name used for predictions in batch outputs.
+    target_column (str): The dataset column the model predicts.
+    features (list of str): The model's input features in training order.
+    differenced_features (dict): Last known value per differenced feature.
+    log_feature (dict): Last known value per log-differenced feature.
+    """
+
+    dtype = np.float64
+
+    def __init__(self, name, label, model_path, output_column, target_column, features, differenced_features, log_feature):
+        self.name = name
+        self.label = label
+        self.model_path = model_path
+        self.output_column = output_column
+        self.target_column = target_column
+        self.features = list(features)
+        self.differenced_features = dict(differenced_features)
+        self.log_feature = dict(log_feature)
+
+        self.differenced_columns = np.array([self.features.index(f) for f in self.differenced_features], dtype=np.intp)
+        self.differenced_values = np.array(list(self.differenced_features.values()), dtype=self.dtype)
+        self.log_columns = np.array([self.features.index(f) for f in self.log_feature], dtype=np.intp)
+        self.log_values = np.array(list(self.log_feature.values()), dtype=self.dtype)
+
+    @classmethod
+    def from_spec(cls, name, spec):
+        return cls(name, **spec)
+
+    def with_baselines(self, values):
+        """
+        Return a copy of the pipeline with the last known values of its differenced and
+        log features replaced by those given; features not in values keep theirs.
+        """
+        return FeaturePipeline(
+            self.name, self.label, self.model_path, self.output_column, self.target_column, self.features,
+            {feature: values.get(feature, value) for feature, value in self.differenced_features.items()},
+            {feature: values.get(feature, value) for feature, value in self.log_feature.items()},
+        )
+
+    def to_matrix(self, data):
+        """
+        Arrange raw inputs into a float64 matrix in the model's feature order.
+
+        Parameters:
+        data (dict, pd.DataFrame or np.ndarray): Raw feature values. A dict may map each feature
+                                                 to a scalar or to an N-element sequence; an array
+                                                 must already be in feature order.
+
+        Returns:
+        np.ndarray: A new (N, 14) float64 matrix.
+        """
+        if isinstance(data, pd.DataFrame):
+            missing = [feature for feature in self.features if feature not in data.columns]
+            if missing:
+                raise KeyError(f"Input is missing columns required by the '{self.name}' model: {missing}")
+            return data[self.features].to_numpy(dtype=self.dtype, copy=True)
+        if isinstance(data, dict):
+            missing = [feature for feature in self.features if feature not in data]
+            if missing:
+                raise KeyError(f"Input is missing columns required by the '{self.name}' model: {missing}")
+            return np.column_stack([np.atleast_1d(np.asarray(data[f], dtype=self.dtype)) for f in self.features])
+
+        matrix = np.array(data, dtype=self.dtype, ndmin=2)
+        if matrix.shape[1] != len(self.features):
+            raise ValueError(f"Expected {len(self.features)} features for the '{self.name}' model, got {matrix.shape[1]}")
+        return matrix
+
+    def transform(self, data, differenced_values=None, log_values=None):
+        """
+        Build the model input matrix from raw feature values.
+
+        Parameters:
+        data (dict, pd.DataFrame or np.ndarray): Raw feature values, see to_matrix.
+        differenced_values (array-like, optional): Per-row last known values of shape (N, k)
+                                                   overriding the pipeline's defaults.
+        log_values (array-like, optional): Per-row last known values for the log features.
+
+        Returns:
+        np.ndarray: The preprocessed (N, 14) float64 matrix, ready to be scored.
+        """
+        matrix = self.to_matrix(data)
+        return transform_matrix(
+            matrix,
+            self.differenced_columns,
+            self.differenced_values if differenced_values is None else differenced_values,
+            self.log_columns,
+            self.log_values if log_values is None else log_values,
+            out=matrix,
+        )
+
+    def transform_history(self, history):
+        """
+        Build model inputs from consecutive daily rows, as the models were fitted: each row's
+        differenced and log features against the previous day's values, the calendar features
+        from the date. The first row, having no previous day, is dropped.
+
+        Parameters:
+        history (pd.DataFrame): Daily rows indexed by date with the model's non-calendar features.
+
+        Returns:
+        np.ndarray: The (N - 1, 14) preprocessed matrix.
+        """
+        raw = history.reindex(columns=self.features)
+        raw['month'] = history.index.month
+        raw['day_of_week'] = history.index.dayofweek
+        matrix = self.to_matrix(raw)
+        return transform_matrix(matrix[1:], self.differenced_columns, matrix[:-1, self.differenced_columns],
+                                self.log_columns, matrix[:-1, self.log_columns])
+
+    def default_inputs(self):
+        """
+        Return the smallest valid raw input for every feature: the last known value of the
+        differenced and log features, January for the month and 0 elsewhere.
+        """
+        defaults = {feature: 0.0 for feature in self.features}
+        defaults.update(self.differenced_features)
+        defaults.update(self.log_feature)
+        defaults['month'] = 1
+        return defaults
+
+    def transform_frame(self, data):
+        return pd.DataFrame(self.transform(data), columns=self.features)
+
+
+PIPELINES = {name: FeaturePipeline.from_spec(name, spec) for name, spec in PIPELINE_SPECS.items()}
+
+def baselines_path(region=DEFAULT_REGION):
+    return os.path.join(region_paths(region)[1], BASELINES_FILE)
+
+def load_baselines(path):
+    """
+    Returns:
+    dict or None: The refreshed baselines, {'as_of': date, 'values': {feature: value}}, if any.
+    """
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+_current = {}
+_current_lock = threading.Lock()
+
+def _current_pipelines(region):
+    """
+    A region's pipelines with its refreshed baselines applied, rebuilt when the baselines file changes.
+    """
+    path = baselines_path(region)
+    try:
+        stat = os.stat(path)
+        stamp = stat.st_mtime_ns, stat.st_size
+    except OSError:
+        stamp = None
+    current = _current.get(region)
+    if current is None or stamp != current[0]:
+        with _current_lock:
+            current = _current.get(region)
+            if current is None or stamp != current[0]:
+                baselines = load_baselines(path) if stamp is not None else None
+                pipelines = PIPELINES
+                if baselines is not None:
+                    pipelines = {name: pipeline.with_baselines(baselines['values']) for name, pipeline in PIPELINES.items()}
+                current = _current[region] = (stamp, baselines, pipelines)
+    return current
+
+def baselines_as_of(region=DEFAULT_REGION):
+    """
+    Returns:
+    pd.Timestamp: The date of the last known values the region's pipelines difference against.
+    """
+    baselines = _current_pipelines(region)[1]
+    return pd.Timestamp(baselines['as_of'] if baselines is not None else BASELINES_AS_OF)
+
+def get_pipeline(name, region=DEFAULT_REGION):
+    """
+    Return the pipeline for name, with the region's latest ingested baselines applied.
+    """
+    try:
+        return _current_pipelines(region)[2][name]
+    except KeyError:
+        raise ValueError(f"Unknown model '{name}', expected one of {sorted(PIPELINES)}") from None
+
+def random_inputs(pipeline, rows, seed=0):
+    """
+    Raw user-scale inputs around the pipeline's defaults, one scenario per row, for
+    benchmarks and parity checks.
+    """
+    rng = np.random.default_rng(seed)
+    defaults = pipeline.default_inputs()
+    return pd.DataFrame({
+        feature: value * (1 + rng.random(rows)) if value else rng.random(rows) * 100
+        for feature, value in defaults.items()
+    })
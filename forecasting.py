@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+from data_store import DEFAULT_REGION, get_store
+from feature_pipeline import get_pipeline
+from model_registry import get_model
+
+CALENDAR_FEATURES = ['month', 'day_of_week']
+# Cumulative features advanced each day by the value of a daily feature.
+CUMULATIVE_DRIVERS = {
+    'totalVaccinations': 'new_vaccinations_smoothed',
+    'totalTests': 'test24hours',
+}
+# Cumulative features advanced by a scenario increment, defaulting to their recent daily growth.
+CUMULATIVE_FEATURES = ['fullyVaccinated', 'partiallyVaccinated']
+SMOOTHING_DAYS = 7
+RECENT_DAYS = 28
+
+
+def _broadcast(value, n_trajectories, horizon):
+    """
+    Expand a scenario value to one value per trajectory and day: a scalar applies to
+    everything, a 1D array holds one value per trajectory and a 2D array a full path.
+    """
+    value = np.asarray(value, dtype=np.float64)
+    if value.ndim == 1:
+        value = value[:, None]
+    return np.broadcast_to(value, (n_trajectories, horizon))
+
+
+class ForecastResult:
+    """
+    Forecast trajectories for a horizon of days.
+
+    Parameters:
+    dates (pd.DatetimeIndex): The forecast dates, one per step.
+    predictions (dict): Model name to a (trajectories, horizon) array of predictions.
+    """
+
+    def __init__(self, dates, predictions):
+        self.dates = dates
+        self.predictions = predictions
+
+    def quantiles(self, name, q=(0.05, 0.5, 0.95)):
+        """
+        Summarize a model's trajectories as quantiles per day.
+
+        Returns:
+        pd.DataFrame: One row per date and one column per quantile.
+        """
+        values = np.quantile(self.predictions[name], q, axis=0)
+        return pd.DataFrame(values.T, index=self.dates, columns=[f'q{round(level * 100)}' for level in q])
+
+
+class ForecastEngine:
+    """
+    Roll the case and death models forward day by day from the last known state,
+    scoring every scenario trajectory of a step in one batched prediction per model.
+
+    The differenced features are differenced against the previous day's state, as in the
+    historical series the models were fitted on, and the deaths predicted for each day feed
+    back into the smoothed new deaths used by the case model on the following days.
+
+    Parameters:
+    history (pd.DataFrame, optional): Historical rows indexed by date, the region's store by default.
+    region (str): The region whose models are used.
+    """
+
+    def __init__(self, history=None, region=DEFAULT_REGION):
+        self.region = region
+        self.cases = get_pipeline('cases', region)
+        self.deaths = get_pipeline('deaths', region)
+        self.columns = sorted(
+            (set(self.cases.features) | set(self.deaths.features) | set(CUMULATIVE_FEATURES)) - set(CALENDAR_FEATURES)
+        )
+        if history is None:
+            history = get_store(region).frame(self.columns + ['population', 'total_deaths'])
+        self.history = history
+        self.positions = {column: position for position, column in enumerate(self.columns)}
+
+    def last_state(self):
+        return self.history[self.columns].iloc[-1].to_numpy(dtype=np.float64)
+
+    def recent_increments(self, days=RECENT_DAYS):
+        """
+        Mean daily growth of the scenario-driven cumulative features over the last days.
+        """
+        recent = self.history[CUMULATIVE_FEATURES].iloc[-(days + 1):]
+        return recent.diff().iloc[1:].clip(lower=0).mean().to_dict()
+
+    def _model_inputs(self, pipeline, state, previous, date):
+        matrix = np.empty((len(state), len(pipeline.features)))
+        for position, feature in enumerate(pipeline.features):
+            if feature == 'month':
+                matrix[:, position] = date.month
+            elif feature == 'day_of_week':
+                matrix[:, position] = date.dayofweek
+            else:
+                matrix[:, position] = state[:, self.positions[feature]]
+        differenced = previous[:, [self.positions[f] for f in pipeline.differenced_features]]
+        logged = previous[:, [self.positions[f] for f in pipeline.log_feature]]
+        return pipeline.transform(matrix, differenced_values=differenced, log_values=logged)
+
+    def _anchor_deaths(self, n_trajectories):
+        """
+        The deaths model's prediction for the last known day, so the first forecast
+        step's new deaths come from the model rather than from its error on that day.
+        """
+        last_two = self.history[self.columns].iloc[-2:].to_numpy(dtype=np.float64)
+        date = self.history.index[-1]
+        inputs = self._model_inputs(self.deaths, last_two[1:], last_two[:1], date)
+        return np.full(n_trajectories, get_model('deaths', self.region).predict(inputs)[0], dtype=np.float64)
+
+    def run(self, horizon, n_trajectories=1, levels=None, increments=None):
+        """
+        Forecast horizon days ahead for n_trajectories scenarios in lockstep.
+
+        Parameters:
+        horizon (int): Number of days to forecast.
+        n_trajectories (int): Number of scenarios scored side by side.
+        levels (dict, optional): Feature name to its value in each scenario, e.g. stringency_index
+                                 or new_vaccinations_smoothed: a scalar, one value per trajectory,
+                                 or a (trajectories, horizon) path. Other features keep their last value.
+        increments (dict, optional): Daily growth of fullyVaccinated and partiallyVaccinated, in the
+                                     same shapes, defaulting to the recent mean daily growth.
+
+        Returns:
+        ForecastResult: The dates and a (trajectories, horizon) array per model.
+        """
+        levels = {feature: _broadcast(value, n_trajectories, horizon) for feature, value in (levels or {}).items()}
+        increments = {**self.recent_increments(), **(increments or {})}
+        increments = {feature: _broadcast(value, n_trajectories, horizon) for feature, value in increments.items()}
+        unknown = [feature for feature in list(levels) + list(increments) if feature not in self.positions]
+        if unknown:
+            raise KeyError(f"Unknown scenario features: {unknown}")
+
+        population = float(self.history['population'].iloc[-1])
+        dates = pd.date_range(self.history.index[-1] + pd.Timedelta(days=1), periods=horizon, freq='D')
+        state = np.tile(self.last_state(), (n_trajectories, 1))
+        cases = np.empty((n_trajectories, horizon))
+        deaths = np.empty((n_trajectories, horizon))
+
+        daily_deaths = np.diff(self.history['total_deaths'].iloc[-(SMOOTHING_DAYS + 1):].to_numpy(dtype=np.float64))
+        recent_deaths = np.tile(np.clip(daily_deaths, 0, None), (n_trajectories, 1))
+        previous_deaths = self._anchor_deaths(n_trajectories)
+        cases_model = get_model('cases', self.region)
+        deaths_model = get_model('deaths', self.region)
+
+        for step, date in enumerate(dates):
+            previous = state.copy()
+            for feature, value in levels.items():
+                state[:, self.positions[feature]] = value[:, step]
+            for feature, driver in CUMULATIVE_DRIVERS.items():
+                state[:, self.positions[feature]] += state[:, self.positions[driver]]
+            state[:, self.positions['total_tests_per_thousand']] += state[:, self.positions['test24hours']] * 1000 / population
+            for feature, value in increments.items():
+                state[:, self.positions[feature]] += value[:, step]
+            state[:, self.positions['new_deaths_smoothed']] = recent_deaths.mean(axis=1)
+
+            deaths[:, step] = deaths_model.predict(self._model_inputs(self.deaths, state, previous, date))
+            cases[:, step] = cases_model.predict(self._model_inputs(self.cases, state, previous, date))
+
+            recent_deaths = np.roll(recent_deaths, -1, axis=1)
+            recent_deaths[:, -1] = np.clip(deaths[:, step] - previous_deaths, 0, None)
+            previous_deaths = deaths[:, step]
+
+        return ForecastResult(dates, {'cases': cases, 'deaths': deaths})
+
+def forecast(horizon, n_trajectories=1, levels=None, increments=None, region=DEFAULT_REGION):
+    return ForecastEngine(region=region).run(horizon, n_trajectories, levels=levels, increments=increments)
@@ -0,0 +1,165 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from data_store import DATE_COLUMN, DEFAULT_REGION, DataStore, append_part, file_hash, list_regions, region_paths
+from feature_pipeline import PIPELINE_SPECS, baselines_path, load_baselines
+from time_series import CUMULATIVE_METRICS
+
+INCOMING_PATH = './assets/data/incoming'
+DROP_FORMATS = ('.csv', '.json')
+# Baselines that follow the latest value; the others are cumulative counts and never decrease.
+LEVEL_FEATURES = ['stringency_index']
+
+
+def read_drop(path):
+    """
+    Read a daily drop file into a frame indexed by date.
+
+    CSV drops have the layout of the source CSV, the dates in the first column.
+    JSON drops hold a list of records, each with a 'date' field.
+    """
+    if path.endswith('.json'):
+        with open(path) as file:
+            df = pd.DataFrame.from_records(json.load(file))
+        if DATE_COLUMN not in df.columns:
+            raise ValueError(f"{path}: every record needs a '{DATE_COLUMN}' field")
+        df = df.set_index(DATE_COLUMN)
+    else:
+        df = pd.read_csv(path, index_col=0)
+    df.index = pd.to_datetime(df.index)
+    df.index.name = DATE_COLUMN
+    return df
+
+def conform(df, columns):
+    """
+    Match a drop to the store schema: columns in store order with the store dtypes,
+    absent columns as NaN, one row per date (the last one wins), sorted by date.
+
+    Parameters:
+    df (pd.DataFrame): The drop, indexed by date.
+    columns (dict): The store's column names and dtypes, from its manifest.
+    """
+    unknown = [column for column in df.columns if column not in columns]
+    if unknown:
+        raise ValueError(f"Unknown columns: {unknown}")
+    df = df[~df.index.duplicated(keep='last')].sort_index()
+    return pd.DataFrame({
+        column: df[column].astype(dtype) if column in df.columns else pd.Series(np.nan, index=df.index, dtype=dtype)
+        for column, dtype in columns.items()
+    }, index=df.index)
+
+def baseline_features():
+    features = {}
+    for spec in PIPELINE_SPECS.values():
+        features.update(spec['differenced_features'])
+        features.update(spec['log_feature'])
+    return features
+
+def cumulative_columns():
+    """
+    The running totals of the store: the Overview metrics, the model targets and the
+    cumulative model features.
+    """
+    columns = list(CUMULATIVE_METRICS)
+    columns += [spec['target_column'] for spec in PIPELINE_SPECS.values()]
+    columns += [feature for feature in baseline_features() if feature not in LEVEL_FEATURES]
+    return list(dict.fromkeys(columns))
+
+def fill_cumulative(df, last_known):
+    """
+    Carry running totals a drop leaves out, or leaves empty on some days, forward from
+    the previous day, starting from the store's last known values: a total missing for
+    a day has not changed as far as the store knows.
+
+    Parameters:
+    df (pd.DataFrame): The conformed drop.
+    last_known (pd.Series): The last known value of each cumulative column.
+    """
+    df = df.copy()
+    for column, value in last_known.items():
+        df[column] = df[column].ffill().fillna(value).astype(df[column].dtype)
+    return df
+
+def refresh_baselines(appended, path):
+    """
+    Move the differencing baselines to the last known values in newly appended rows.
+
+    Parameters:
+    appended (pd.DataFrame): The appended rows, indexed by date.
+    path (str): The region's baselines file.
+
+    Returns:
+    dict: The baselines written, {'as_of': date, 'values': {feature: value}}.
+    """
+    current = load_baselines(path)
+    values = baseline_features() if current is None else dict(current['values'])
+    last_known = appended[list(values)].ffill().iloc[-1]
+    for feature, value in last_known.items():
+        if pd.isna(value):
+            continue
+        values[feature] = float(value) if feature in LEVEL_FEATURES else max(values[feature], float(value))
+
+    baselines = {'as_of': appended.index[-1].date().isoformat(), 'values': values}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(baselines, file, indent=2)
+    os.replace(path + '.tmp', path)
+    return baselines
+
+def drop_files(incoming_path=INCOMING_PATH):
+    if not os.path.isdir(incoming_path):
+        return []
+    return sorted(os.path.join(incoming_path, name) for name in os.listdir(incoming_path) if name.endswith(DROP_FORMATS))
+
+def ingest(paths, region=DEFAULT_REGION):
+    """
+    Append the rows of drop files to a region's store, one part per file, in the order given.
+
+    Files already ingested (by content hash) are skipped, as are rows dated on or before
+    the store's last row, since the store is append-only. Existing parts, aggregates and
+    range tables are not rebuilt: the app extends them with the new rows on next access.
+
+    Returns:
+    list of dict: One summary per file: its path, the rows appended and skipped, and the status.
+    """
+    csv_path, store_path = region_paths(region)
+    store = DataStore(store_path, csv_path)
+    manifest = store.manifest
+    last_known = store.last_known(cumulative_columns())
+    summaries = []
+    appended_frames = []
+    for path in paths:
+        source_hash = file_hash(path)
+        if source_hash in manifest['ingested']:
+            summaries.append({'path': path, 'appended': 0, 'skipped': 0, 'status': 'already ingested'})
+            continue
+
+        df = conform(read_drop(path), manifest['columns'])
+        new = fill_cumulative(df[df.index > pd.Timestamp(manifest['last_date'])], last_known)
+        manifest = append_part(new, store_path, source_hash)
+        if len(new):
+            appended_frames.append(new)
+            last_known = new[last_known.index].iloc[-1]
+        summaries.append({'path': path, 'appended': len(new), 'skipped': len(df) - len(new), 'status': 'ok'})
+
+    if appended_frames:
+        refresh_baselines(pd.concat(appended_frames), baselines_path(region))
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Append daily CSV/JSON drops to the columnar data store.')
+    parser.add_argument('paths', nargs='*', help=f'Drop files, by default every CSV/JSON file in {INCOMING_PATH}')
+    parser.add_argument('--incoming', default=INCOMING_PATH, help='Directory scanned for drops when no paths are given')
+    parser.add_argument('--region', default=DEFAULT_REGION, choices=list_regions(), help='Region the drops belong to')
+    args = parser.parse_args(argv)
+
+    paths = args.paths or drop_files(args.incoming)
+    for summary in ingest(paths, args.region):
+        print(f"{summary['path']}: {summary['status']}, {summary['appended']} rows appended, {summary['skipped']} skipped")
+
+
+if __name__ == '__main__':
+    main()
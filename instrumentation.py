@@ -0,0 +1,179 @@
+import time
+import bisect
+import threading
+import functools
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from cache hits up to cold model loads.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_PREFIX = 'covid_app'
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram of durations, as in the Prometheus exposition format.
+    Not thread-safe on its own; Metrics guards it.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.first = None
+
+    def observe(self, value):
+        if self.first is None:
+            self.first = value
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in,
+        or the largest value seen when it is beyond the last bucket.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """
+    Process-wide stage timings and counters shared by every session and request.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def first(self, stage):
+        """
+        Returns:
+        float: The first duration observed for the stage, e.g. its cold-start cost, or None.
+        """
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            return histogram.first if histogram is not None else None
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        """
+        Returns:
+        tuple: A list with one summary dict per stage (times in seconds) and a dict of counters.
+        """
+        with self._lock:
+            stages = [
+                {
+                    'stage': stage,
+                    'count': histogram.count,
+                    'total': histogram.sum,
+                    'mean': histogram.sum / histogram.count,
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                    'max': histogram.max,
+                }
+                for stage, histogram in sorted(self._histograms.items())
+            ]
+            return stages, dict(sorted(self._counters.items()))
+
+    def prometheus(self, prefix=METRIC_PREFIX):
+        """
+        Render the metrics in the Prometheus text exposition format.
+        """
+        lines = [
+            f'# HELP {prefix}_stage_seconds Time spent in each instrumented stage.',
+            f'# TYPE {prefix}_stage_seconds histogram',
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+            for name, value in sorted(self._counters.items()):
+                lines.append(f'# TYPE {prefix}_{name}_total counter')
+                lines.append(f'{prefix}_{name}_total {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+_local = threading.local()
+
+
+def observe(stage, seconds):
+    """
+    Record a duration into the stage's histogram and into the current trace, if any.
+    """
+    metrics.observe(stage, seconds)
+    spans = getattr(_local, 'spans', None)
+    if spans is not None:
+        spans.append((stage, seconds))
+
+@contextmanager
+def timed(stage):
+    """
+    Time a block with observe.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+def instrumented(stage):
+    """
+    Decorator form of timed.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def increment(name, value=1):
+    metrics.increment(name, value)
+
+@contextmanager
+def trace():
+    """
+    Collect the (stage, seconds) spans timed on this thread inside the block, e.g. one
+    Streamlit rerun, which runs on its session's script thread.
+    """
+    previous = getattr(_local, 'spans', None)
+    spans = _local.spans = []
+    try:
+        yield spans
+    finally:
+        _local.spans = previous
@@ -0,0 +1,52 @@
+import sys
+import time
+import threading
+import importlib
+from instrumentation import metrics, observe, timed
+
+# Set when the first module of the app imports this one, close to process start.
+PROCESS_START = time.perf_counter()
+
+_startup_stages = []
+_lock = threading.Lock()
+
+
+def startup_stage(stage):
+    """
+    List a timed stage in the startup report, which shows the first duration of each
+    stage in the order they were listed.
+    """
+    with _lock:
+        if stage not in _startup_stages:
+            _startup_stages.append(stage)
+    return stage
+
+def record_once(stage, seconds):
+    """
+    Record a one-off startup cost, keeping the first measurement of the stage.
+    """
+    if metrics.first(stage) is None:
+        observe(startup_stage(stage), seconds)
+
+def load_module(name):
+    """
+    Import a module on first use and record how long the import took.
+    Later calls return the already imported module.
+    """
+    module = sys.modules.get(name)
+    if module is None:
+        with timed(startup_stage(f'import_{name}')):
+            module = importlib.import_module(name)
+    return module
+
+def load_attr(name, attr):
+    return getattr(load_module(name), attr)
+
+def startup_report():
+    """
+    Returns:
+    list: (stage, seconds) pairs of the startup stages, with their first duration.
+    """
+    with _lock:
+        stages = list(_startup_stages)
+    return [(stage, metrics.first(stage)) for stage in stages if metrics.first(stage) is not None]
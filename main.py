@@ -1,8 +1,16 @@
+import time
 import streamlit as st
-from st_pages.eda_page import main as eda_page
-from st_pages.home_page import main as home_page
-from st_pages.model_page import main as model_page
-from st_pages.overview_page import main as overview_page
+from lazy_loading import PROCESS_START, load_attr, record_once, startup_report, startup_stage
+from instrumentation import trace, timed
+
+# Page modules are imported the first time their tab is opened, so a cold start
+# only pays for the Home tab instead of plotly, the data store and XGBoost.
+PAGES = {
+    'Home': 'st_pages.home_page',
+    'Overview': 'st_pages.overview_page',
+    'EDA': 'st_pages.eda_page',
+    'Model': 'st_pages.model_page',
+}
 
 st.set_page_config(page_title='COVID-19 Case Prediction App', page_icon='assets/img/favicon.png', layout='wide')
 st.write("""
@@ -19,9 +27,21 @@ div[data-testid="stMetric"]
          
 """, unsafe_allow_html=True)
 
-home, overview, eda, model = st.tabs(['Home', 'Overview', 'EDA', 'Model'])
+# Only the open tab's body runs; switching tabs reruns the script.
+tabs = st.tabs(list(PAGES), key='page', on_change='rerun')
+
+with trace() as spans:
+    for (name, module), tab in zip(PAGES.items(), tabs):
+        if tab.open:
+            with timed(startup_stage(f'render_{name.lower()}')):
+                load_attr(module, 'main')(tab)
+
+record_once('first_page_ready', time.perf_counter() - PROCESS_START)
+
+if 'startup' in st.query_params:
+    with st.expander("Startup report"):
+        st.dataframe([{'step': label, 'seconds': round(seconds, 3)} for label, seconds in startup_report()],
+                     use_container_width=True, hide_index=True)
 
-home_page(home)
-overview_page(overview)
-eda_page(eda)
-model_page(model)
\ No newline at end of file
+if 'diagnostics' in st.query_params:
+    load_attr('st_pages.diagnostics_panel', 'main')(spans)
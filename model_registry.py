@@ -0,0 +1,168 @@
+import os
+import pickle
+import threading
+import xgboost as xgb
+from compact_model import CompactForest, compact_path, content_version
+from data_store import DEFAULT_REGION
+from feature_pipeline import get_pipeline
+from instrumentation import increment, instrumented, timed
+
+NATIVE_FORMATS = ('.ubj', '.json')
+# A region may have its own models, named like the shared ones, in a directory here.
+REGION_MODELS_PATH = 'assets/model/regions'
+# Batches up to this many rows are scored with the CompactForest export, when there is one.
+COMPACT_MAX_ROWS = 4
+
+
+class LoadedModel:
+    """
+    An XGBoost Booster together with where it came from.
+
+    Parameters:
+    name (str): The model name, a key of feature_pipeline.PIPELINES.
+    booster (xgb.Booster): The loaded booster. Prediction on it is thread-safe, so one
+                           instance is shared by every session and request.
+    path (str): The file the booster was loaded from.
+    stamp (tuple): The (mtime_ns, size) of the file when it was loaded.
+    version (str): A short content hash of the file, stable across processes.
+    compact (CompactForest, optional): The array-backed export of the booster, used for small batches.
+                                       Only set when it was exported from this very file.
+    """
+
+    def __init__(self, name, booster, path, stamp, version, compact=None):
+        self.name = name
+        self.booster = booster
+        self.path = path
+        self.stamp = stamp
+        self.version = version
+        self.compact = compact
+
+    def predict(self, matrix):
+        """
+        Score a preprocessed (N, 14) matrix in one call.
+        """
+        increment('predicted_rows', len(matrix))
+        with timed(f'predict_{self.name}'):
+            if self.compact is not None and len(matrix) <= COMPACT_MAX_ROWS:
+                return self.compact.predict(matrix)
+            return self.booster.inplace_predict(matrix)
+
+
+def native_path(model_path, extension='.ubj'):
+    return os.path.splitext(model_path)[0] + extension
+
+def resolve_model_path(model_path):
+    """
+    Prefer a native UBJSON/JSON export sitting next to the pickle over the pickle itself.
+    """
+    for extension in NATIVE_FORMATS:
+        candidate = native_path(model_path, extension)
+        if os.path.exists(candidate):
+            return candidate
+    return model_path
+
+def region_model_path(model_path, region=DEFAULT_REGION):
+    """
+    Return the region's own model when it has one, the shared model otherwise.
+    """
+    if region != DEFAULT_REGION:
+        regional = resolve_model_path(os.path.join(REGION_MODELS_PATH, region, os.path.basename(model_path)))
+        if os.path.exists(regional):
+            return regional
+    return resolve_model_path(model_path)
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+def load_booster(path):
+    if path.endswith(NATIVE_FORMATS):
+        return xgb.Booster(model_file=path)
+    with open(path, 'rb') as file:
+        model = pickle.load(file)
+    return model.get_booster() if hasattr(model, 'get_booster') else model
+
+
+class ModelRegistry:
+    """
+    Load each model once per process and hand out the shared Booster.
+
+    The file on disk is checked on every lookup; when its modification time or size
+    changes the model is reloaded, so replacing a model file takes effect without a restart.
+
+    Parameters:
+    nthread (int, optional): Number of threads XGBoost uses per prediction call.
+    """
+
+    def __init__(self, nthread=None):
+        self.nthread = nthread
+        self._models = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def get(self, name, region=DEFAULT_REGION):
+        """
+        Return the LoadedModel for name in a region, loading or reloading it if needed.
+        Models are keyed by file, so regions without their own model share the default one.
+        """
+        return self.get_file(name, region_model_path(get_pipeline(name).model_path, region))
+
+    def get_file(self, name, path):
+        """
+        Return the LoadedModel for a model file, loading or reloading it if needed.
+
+        Parameters:
+        name (str): The name the model is reported under, in its timings and cache keys.
+        path (str): The model file.
+        """
+        stamp = _file_stamp(path)
+        model = self._models.get(path)
+        if model is not None and model.stamp == stamp:
+            return model
+
+        with self._load_lock(path):
+            model = self._models.get(path)
+            if model is not None and model.stamp == _file_stamp(path):
+                return model
+            model = self._load(name, path)
+            self._models[path] = model
+            return model
+
+    def _load_lock(self, key):
+        with self._lock:
+            return self._load_locks.setdefault(key, threading.Lock())
+
+    @instrumented('model_load')
+    def _load(self, name, path):
+        stamp = _file_stamp(path)
+        with open(path, 'rb') as file:
+            version = content_version(file.read())
+        booster = load_booster(path)
+        if self.nthread is not None:
+            booster.set_param({'nthread': self.nthread})
+        return LoadedModel(name, booster, path, stamp, version, _load_compact(path, version))
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+
+def _load_compact(path, version):
+    """
+    Load the compact export next to a model file, unless it was exported from another
+    model: a file replaced without re-exporting must not keep its old trees serving.
+    """
+    try:
+        compact = CompactForest.load(compact_path(path))
+    except (OSError, KeyError, ValueError):
+        return None
+    if compact.source != version:
+        increment('compact_mismatches')
+        return None
+    return compact
+
+
+registry = ModelRegistry()
+
+def get_model(name, region=DEFAULT_REGION):
+    return registry.get(name, region)
@@ -0,0 +1,135 @@
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from data_store import DEFAULT_REGION
+from feature_pipeline import get_pipeline
+from model_registry import get_model
+from instrumentation import increment
+
+MAX_ENTRIES = 100_000
+TTL_SECONDS = 3600
+
+
+def normalize(matrix):
+    """
+    Normalize preprocessed feature vectors for use as cache keys: XGBoost scores float32
+    inputs, so vectors equal in float32 share a prediction; adding 0 turns -0.0 into 0.0.
+    """
+    return np.ascontiguousarray(matrix, dtype=np.float32) + np.float32(0)
+
+
+class PredictionCache:
+    """
+    A thread-safe LRU cache of predictions with a time-to-live and hit/miss counters.
+
+    Parameters:
+    max_entries (int): Entries kept before the least recently used one is evicted.
+    ttl (float): Seconds an entry stays valid, None to keep entries until evicted.
+    clock (callable): Time source, monotonic seconds by default.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, keys):
+        """
+        Look up several keys at once.
+
+        Returns:
+        list: The cached value for each key, or None where there is none.
+        """
+        now = self.clock()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and self.ttl is not None and now - entry[1] > self.ttl:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    values.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    values.append(entry[0])
+        return values
+
+    def put_many(self, items):
+        now = self.clock()
+        with self._lock:
+            for key, value in items:
+                self._entries[key] = (value, now)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+prediction_cache = PredictionCache()
+
+def cached_predict(model, matrix, cache=prediction_cache):
+    """
+    Score a preprocessed matrix, taking repeated rows from the cache and scoring
+    only the distinct misses, in one predict call.
+
+    Parameters:
+    model (LoadedModel): The model from the registry; its name and version are part of the key.
+    matrix (np.ndarray): The preprocessed (N, 14) matrix.
+    cache (PredictionCache): The cache to use.
+
+    Returns:
+    np.ndarray: One float32 prediction per row.
+    """
+    rows = normalize(matrix)
+    keys = [(model.name, model.version, row.tobytes()) for row in rows]
+    cached = cache.get_many(keys)
+
+    # Rows repeated within the call are scored once.
+    missing = {}
+    for position, (key, value) in enumerate(zip(keys, cached)):
+        if value is None:
+            missing.setdefault(key, position)
+    increment('prediction_cache_hits', len(keys) - cached.count(None))
+    increment('prediction_cache_misses', cached.count(None))
+    if missing:
+        scored = model.predict(rows[list(missing.values())]).tolist()
+        scored = dict(zip(missing, scored))
+        cache.put_many(scored.items())
+        cached = [scored[key] if value is None else value for key, value in zip(keys, cached)]
+    return np.asarray(cached, dtype=np.float32)
+
+def predict(name, data, cache=prediction_cache, region=DEFAULT_REGION):
+    """
+    Preprocess raw inputs with the region's pipeline and score them through the cache
+    with the region's model.
+    """
+    return cached_predict(get_model(name, region), get_pipeline(name, region).transform(data), cache)
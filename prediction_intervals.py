@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from data_store import DEFAULT_REGION, get_store, list_regions
+from feature_pipeline import PIPELINES, get_pipeline
+from model_registry import REGION_MODELS_PATH, get_model
+from training import training_data
+
+INTERVAL_QUANTILES = (0.05, 0.95)
+INTERVAL_SUFFIX = '_intervals'
+# The served model's configuration is refitted this many times, each time without one
+# random share of the days, to measure its error on days it was not fitted on.
+CALIBRATION_FOLDS = 5
+# The training parameters carried over from the served booster's configuration.
+SERVED_PARAMS = ('eta', 'gamma', 'max_depth', 'min_child_weight', 'max_delta_step', 'subsample', 'colsample_bytree',
+                 'colsample_bylevel', 'colsample_bynode', 'lambda', 'alpha', 'max_bin')
+
+
+def interval_file_path(model_path):
+    return os.path.splitext(model_path)[0] + INTERVAL_SUFFIX + '.json'
+
+def interval_path(name, region=DEFAULT_REGION):
+    """
+    Return the interval calibration used for name in a region: the region's own when it has one.
+    """
+    path = interval_file_path(get_pipeline(name).model_path)
+    if region != DEFAULT_REGION:
+        regional = os.path.join(REGION_MODELS_PATH, region, os.path.basename(path))
+        if os.path.exists(regional):
+            return regional
+    return path
+
+def has_intervals(name, region=DEFAULT_REGION):
+    return os.path.exists(interval_path(name, region))
+
+def quantile_columns(quantiles):
+    return [f'q{round(level * 100)}' for level in quantiles]
+
+
+def served_params(booster):
+    """
+    The training parameters of a booster, read back from its saved configuration, so that
+    a pickled model can be refitted the way it was trained.
+    """
+    learner = json.loads(booster.save_config())['learner']
+    tree = learner['gradient_booster']['tree_train_param']
+    params = {key: float(tree[key]) for key in SERVED_PARAMS}
+    params['max_depth'], params['max_bin'] = int(params['max_depth']), int(params['max_bin'])
+    return dict(params, objective=learner['learner_train_param']['objective'], tree_method='hist',
+                seed=int(learner['generic_param']['seed']))
+
+def out_of_fold_residuals(booster, matrix, targets, folds=CALIBRATION_FOLDS, seed=0):
+    """
+    The error of the booster's configuration on every day, each measured with a refit
+    (same parameters and rounds) on the days of the other folds.
+
+    Returns:
+    np.ndarray: target - prediction, one per day.
+    """
+    params = served_params(booster)
+    rounds = booster.num_boosted_rounds()
+    assignment = np.random.default_rng(seed).integers(folds, size=len(targets))
+    residuals = np.empty(len(targets))
+    for fold in range(folds):
+        held_out = assignment == fold
+        refit = xgb.train(params, xgb.DMatrix(matrix[~held_out], targets[~held_out]), rounds)
+        residuals[held_out] = targets[held_out] - refit.inplace_predict(matrix[held_out])
+    return residuals
+
+def _bounds(predictions, offsets):
+    predictions = np.asarray(predictions, dtype=np.float64)
+    # The targets are counts: no bound goes below 0, unless the prediction itself does.
+    return np.maximum(predictions[:, None] + np.asarray(offsets), np.minimum(predictions, 0)[:, None])
+
+def calibrate_intervals(name, region=DEFAULT_REGION, quantiles=INTERVAL_QUANTILES, folds=CALIBRATION_FOLDS):
+    """
+    Calibrate prediction intervals for the served model on a region's history: quantiles
+    of its residuals, added to its prediction when an interval is asked for. Each day's
+    residual is the larger of the served model's own error, which is too small on days it
+    was fitted on, and its configuration's out-of-fold error, which misses how far the
+    served model is from a refit on the current history.
+
+    They are saved as JSON where interval_path looks for them, next to the shared model or
+    among the region's models, with the version of the model they were calibrated for; a
+    model retrained or promoted since has no intervals until calibrated again.
+
+    Returns:
+    tuple: The written path and the calibration, including the share of stored days
+           inside the served model's own interval.
+    """
+    model = get_model(name, region)
+    matrix, targets = training_data(name, region)
+    predictions = model.predict(matrix)
+    served = targets - predictions
+    refitted = out_of_fold_residuals(model.booster, matrix, targets, folds)
+    offsets = np.quantile(np.where(np.abs(served) > np.abs(refitted), served, refitted), quantiles)
+    # Bounds on either side of the median never cross the prediction, so every interval contains it.
+    offsets = np.where(np.array(quantiles) < 0.5, np.minimum(offsets, 0), np.maximum(offsets, 0))
+    bounds = _bounds(predictions, offsets)
+    calibration = {
+        'model_version': model.version,
+        'data_revision': get_store(region).content_hash,
+        'quantiles': list(quantiles),
+        'offsets': offsets.tolist(),
+        'folds': folds,
+        'rows': len(targets),
+        'coverage': float(np.mean((targets >= bounds[:, 0]) & (targets <= bounds[:, -1]))),
+    }
+
+    path = interval_file_path(get_pipeline(name).model_path)
+    if region != DEFAULT_REGION:
+        path = os.path.join(REGION_MODELS_PATH, region, os.path.basename(path))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(calibration, file, indent=2)
+    os.replace(temporary, path)
+    return path, calibration
+
+
+_calibrations = {}
+
+def load_calibration(model, region=DEFAULT_REGION):
+    """
+    The interval calibration of a served model in a region, or None when there is none
+    for this very model: one calibrated for another version of it is ignored.
+    """
+    path = interval_path(model.name, region)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    stamp = stat.st_mtime_ns, stat.st_size
+    cached = _calibrations.get(path)
+    if cached is None or cached[0] != stamp:
+        try:
+            with open(path) as file:
+                cached = _calibrations[path] = stamp, json.load(file)
+        except (OSError, ValueError):
+            return None
+    calibration = cached[1]
+    return calibration if calibration.get('model_version') == model.version else None
+
+def interval_bounds(model, predictions, region=DEFAULT_REGION):
+    """
+    The prediction intervals around a served model's predictions, each containing its prediction.
+
+    Parameters:
+    model (LoadedModel): The model that made the predictions.
+    predictions (array-like): Its predictions, unchanged by the interval.
+    region (str): The region whose calibration is used.
+
+    Returns:
+    pd.DataFrame: One row per prediction and one column per quantile, named like q5, q95.
+    """
+    calibration = load_calibration(model, region)
+    if calibration is None:
+        raise FileNotFoundError(f"No prediction intervals calibrated for the served '{model.name}' model, "
+                                f"calibrate them with: python prediction_intervals.py calibrate")
+    return pd.DataFrame(_bounds(predictions, calibration['offsets']), columns=quantile_columns(calibration['quantiles']))
+
+def format_interval(intervals, row=0):
+    """
+    Describe the outer quantiles of one row, e.g. '90% prediction interval: 12.000 to 20.000'.
+    """
+    low, high = intervals.columns[0], intervals.columns[-1]
+    level = int(high[1:]) - int(low[1:])
+    return f"{level}% prediction interval: {intervals[low].iloc[row]: .3f} to {intervals[high].iloc[row]: .3f}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Calibrate the prediction intervals of the served models.')
+    parser.add_argument('command', choices=['calibrate'])
+    parser.add_argument('--model', action='append', choices=list(PIPELINES), help='Model to calibrate, repeatable (default: all)')
+    parser.add_argument('--region', default=DEFAULT_REGION, choices=list_regions(), help='Region whose model and history are used')
+    parser.add_argument('--quantile', action='append', type=float, help=f'Quantile of the residuals, repeatable (default: {INTERVAL_QUANTILES})')
+    parser.add_argument('--folds', type=int, default=CALIBRATION_FOLDS, help='Refits measuring the out-of-fold residuals')
+    args = parser.parse_args(argv)
+
+    quantiles = tuple(sorted(args.quantile)) if args.quantile else INTERVAL_QUANTILES
+    for name in args.model or list(PIPELINES):
+        path, calibration = calibrate_intervals(name, args.region, quantiles, args.folds)
+        offsets = ', '.join(f'{offset:+.3f}' for offset in calibration['offsets'])
+        print(f"{name}: wrote {path}, offsets {offsets} around the prediction, "
+              f"{calibration['coverage']:.1%} of stored days inside [{quantiles[0]}, {quantiles[-1]}]")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
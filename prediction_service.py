@@ -0,0 +1,336 @@
+import os
+import math
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from aiohttp import web
+from data_store import DEFAULT_REGION, list_regions
+from feature_pipeline import PIPELINES, get_pipeline
+from model_registry import ModelRegistry
+from prediction_cache import PredictionCache, cached_predict
+from prediction_intervals import interval_bounds, load_calibration
+from instrumentation import increment, metrics, timed
+
+MAX_BATCH_ROWS = 4096
+MAX_DELAY = 0.001
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent prediction requests for one model into a single predict call.
+
+    At most `workers` batches are scored at a time. While they are busy new requests
+    queue up, so under load batches grow on their own; when idle a request waits at
+    most max_delay seconds for company.
+
+    Parameters:
+    predict (callable): Scores a raw (N, 14) matrix and returns N predictions.
+    executor (concurrent.futures.Executor): Pool the predict calls run in.
+    workers (int): Maximum number of batches scored concurrently.
+    max_batch_rows (int): Rows after which a batch is closed.
+    max_delay (float): Seconds to wait for more requests before scoring a batch.
+    """
+
+    def __init__(self, predict, executor, workers, max_batch_rows=MAX_BATCH_ROWS, max_delay=MAX_DELAY):
+        self.predict = predict
+        self.executor = executor
+        self.max_batch_rows = max_batch_rows
+        self.max_delay = max_delay
+        self._workers = asyncio.Semaphore(workers)
+        self._queue = asyncio.Queue()
+        self._task = None
+        self.batches = 0
+        self.rows = 0
+
+    async def submit(self, matrix):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((matrix, future))
+        return await future
+
+    def _drain(self, batch, rows):
+        while rows < self.max_batch_rows and not self._queue.empty():
+            item = self._queue.get_nowait()
+            batch.append(item)
+            rows += len(item[0])
+        return rows
+
+    async def _run(self):
+        while True:
+            await self._workers.acquire()
+            batch = [await self._queue.get()]
+            rows = self._drain(batch, len(batch[0][0]))
+            if rows < self.max_batch_rows and self.max_delay > 0:
+                await asyncio.sleep(self.max_delay)
+                self._drain(batch, rows)
+            asyncio.create_task(self._score(batch))
+
+    async def _score(self, batch):
+        try:
+            matrix = np.vstack([item[0] for item in batch])
+            predictions = await asyncio.get_running_loop().run_in_executor(self.executor, self.predict, matrix)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._workers.release()
+
+        self.batches += 1
+        self.rows += len(matrix)
+        increment('service_batches')
+        offset = 0
+        for rows, future in batch:
+            if not future.done():
+                future.set_result(predictions[offset:offset + len(rows)])
+            offset += len(rows)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+
+class PredictionService:
+    """
+    Holds the models and one MicroBatcher per model and region for the HTTP handlers.
+
+    Parameters:
+    workers (int, optional): Size of the scoring thread pool, the number of cores by default.
+                             Each predict call then uses one XGBoost thread.
+    """
+
+    def __init__(self, workers=None, max_batch_rows=MAX_BATCH_ROWS, max_delay=MAX_DELAY):
+        self.workers = workers or os.cpu_count() or 1
+        self.registry = ModelRegistry(nthread=1)
+        self.cache = PredictionCache()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='predict')
+        self.max_batch_rows = max_batch_rows
+        self.max_delay = max_delay
+        self.batchers = {}
+
+    def _predictor(self, name, region):
+        # The pipeline is looked up per batch so refreshed baselines apply without a restart.
+        return lambda matrix: cached_predict(self.registry.get(name, region), get_pipeline(name, region).transform(matrix),
+                                             self.cache)
+
+    def _batcher(self, key, predictor):
+        batcher = self.batchers.get(key)
+        if batcher is None:
+            batcher = self.batchers[key] = MicroBatcher(predictor, self.executor, self.workers, self.max_batch_rows,
+                                                        self.max_delay)
+        return batcher
+
+    async def predict(self, name, matrix, region=DEFAULT_REGION):
+        return await self._batcher((name, region), self._predictor(name, region)).submit(matrix)
+
+    def intervals(self, name, predictions, region=DEFAULT_REGION):
+        """
+        Returns:
+        pd.DataFrame: The prediction intervals around predictions, one column per quantile.
+        """
+        return interval_bounds(self.registry.get(name, region), predictions, region)
+
+    async def close(self):
+        for batcher in self.batchers.values():
+            await batcher.close()
+        self.executor.shutdown(wait=False)
+
+
+def _pipeline_or_404(request):
+    name = request.match_info['model']
+    if name not in PIPELINES:
+        raise web.HTTPNotFound(text=f"Unknown model '{name}', expected one of {sorted(PIPELINES)}")
+    return get_pipeline(name, _region_or_404(request))
+
+def _region_or_404(request):
+    region = request.query.get('region', DEFAULT_REGION)
+    if region not in list_regions():
+        raise web.HTTPNotFound(text=f"Unknown region '{region}', expected one of {list_regions()}")
+    return region
+
+def _wants_interval(request, name, region):
+    if 'interval' not in request.query:
+        return False
+    if load_calibration(request.app['service'].registry.get(name, region), region) is None:
+        raise web.HTTPNotFound(text=f"No prediction intervals calibrated for the served '{name}' model")
+    return True
+
+async def _json_body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Request body must be JSON") from None
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="Request body must be a JSON object")
+    return body
+
+def _to_matrix(pipeline, data):
+    try:
+        return pipeline.to_matrix(data)
+    except (KeyError, ValueError, TypeError) as e:
+        raise web.HTTPBadRequest(text=str(e)) from None
+
+def _check_number(value, where):
+    # bool is an int in Python, but true/false is no feature value.
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise web.HTTPBadRequest(text=f"{where} must be a finite number, got {value!r}")
+    try:
+        number = float(value)
+    except OverflowError:
+        raise web.HTTPBadRequest(text=f"{where} is too large for a float")
+    if not math.isfinite(number):
+        raise web.HTTPBadRequest(text=f"{where} must be a finite number, got {value!r}")
+
+def _check_row(pipeline, row, where):
+    if not isinstance(row, dict):
+        raise web.HTTPBadRequest(text=f"{where} must be a JSON object")
+    for feature in pipeline.features:
+        if feature not in row:
+            raise web.HTTPBadRequest(text=f"{where} is missing '{feature}'")
+        _check_number(row[feature], f"'{feature}' of {where}")
+
+def _check_columns(pipeline, columns):
+    if not isinstance(columns, dict):
+        raise web.HTTPBadRequest(text="'columns' must be a JSON object")
+    lengths = set()
+    for feature in pipeline.features:
+        if feature not in columns:
+            raise web.HTTPBadRequest(text=f"'columns' is missing '{feature}'")
+        values = columns[feature]
+        if not isinstance(values, list) or not values:
+            raise web.HTTPBadRequest(text=f"Column '{feature}' must be a non-empty list")
+        for position, value in enumerate(values):
+            _check_number(value, f"'{feature}' of row {position}")
+        lengths.add(len(values))
+    if len(lengths) > 1:
+        raise web.HTTPBadRequest(text="Every column must have the same number of values")
+
+async def predict_one(request):
+    """
+    POST /predict/{model}?region={region} with {"features": {name: value, ...}}.
+    With ?interval the prediction interval around the prediction is added.
+    """
+    pipeline = _pipeline_or_404(request)
+    region = _region_or_404(request)
+    interval = _wants_interval(request, pipeline.name, region)
+    body = await _json_body(request)
+    features = body.get('features', body)
+    _check_row(pipeline, features, "'features'")
+    matrix = _to_matrix(pipeline, features)
+    if len(matrix) != 1:
+        raise web.HTTPBadRequest(text="Use /predict/{model}/batch to score more than one row")
+    service = request.app['service']
+    predictions = await service.predict(pipeline.name, matrix, region)
+    response = {
+        'model': pipeline.name,
+        'region': region,
+        'version': service.registry.get(pipeline.name, region).version,
+        'prediction': float(predictions[0]),
+    }
+    if interval:
+        intervals = service.intervals(pipeline.name, predictions, region)
+        response['interval'] = {column: float(values.iloc[0]) for column, values in intervals.items()}
+    return web.json_response(response)
+
+async def predict_batch(request):
+    """
+    POST /predict/{model}/batch?region={region} with {"rows": [{name: value, ...}, ...]} or
+    {"columns": {name: [values], ...}}. With ?interval the prediction intervals are added.
+    """
+    pipeline = _pipeline_or_404(request)
+    region = _region_or_404(request)
+    interval = _wants_interval(request, pipeline.name, region)
+    body = await _json_body(request)
+    if 'rows' in body:
+        rows = body['rows']
+        if not isinstance(rows, list) or not rows:
+            raise web.HTTPBadRequest(text="'rows' must be a non-empty list")
+        for position, row in enumerate(rows):
+            _check_row(pipeline, row, f"row {position}")
+        matrix = _to_matrix(pipeline, {feature: [row[feature] for row in rows] for feature in pipeline.features})
+    elif 'columns' in body:
+        _check_columns(pipeline, body['columns'])
+        matrix = _to_matrix(pipeline, body['columns'])
+    else:
+        raise web.HTTPBadRequest(text="Expected 'rows' or 'columns' in the request body")
+
+    service = request.app['service']
+    predictions = await service.predict(pipeline.name, matrix, region)
+    response = {
+        'model': pipeline.name,
+        'region': region,
+        'version': service.registry.get(pipeline.name, region).version,
+        'predictions': predictions.tolist(),
+    }
+    if interval:
+        intervals = service.intervals(pipeline.name, predictions, region)
+        response['intervals'] = {column: values.tolist() for column, values in intervals.items()}
+    return web.json_response(response)
+
+@web.middleware
+async def timing_middleware(request, handler):
+    resource = request.match_info.route.resource
+    with timed(f"http {request.method} {resource.canonical if resource else 'unmatched'}"):
+        return await handler(request)
+
+async def metrics_text(request):
+    """
+    GET /metrics in the Prometheus text format.
+    """
+    return web.Response(text=metrics.prometheus(), content_type='text/plain', charset='utf-8')
+
+async def health(request):
+    return web.json_response({'status': 'ok', 'models': sorted(PIPELINES), 'regions': list_regions(),
+                              'cache': request.app['service'].cache.stats()})
+
+async def models(request):
+    service = request.app['service']
+    response = {}
+    for name, pipeline in PIPELINES.items():
+        model = service.registry.get(name)
+        response[name] = {'features': pipeline.features, 'version': model.version,
+                          'intervals': load_calibration(model) is not None}
+    return web.json_response(response)
+
+def create_app(service=None):
+    """
+    Build the aiohttp application. Models are loaded at startup, not on the first request.
+    """
+    app = web.Application(middlewares=[timing_middleware])
+    app['service'] = service or PredictionService()
+
+    async def on_startup(app):
+        for name in PIPELINES:
+            app['service'].registry.get(name)
+
+    async def on_cleanup(app):
+        await app['service'].close()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_get('/health', health)
+    app.router.add_get('/models', models)
+    app.router.add_get('/metrics', metrics_text)
+    app.router.add_post('/predict/{model}', predict_one)
+    app.router.add_post('/predict/{model}/batch', predict_batch)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the COVID-19 XGBoost models over HTTP/JSON.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None, help='Scoring threads, the number of cores by default')
+    parser.add_argument('--max-batch-rows', type=int, default=MAX_BATCH_ROWS, help='Rows after which a micro-batch is closed')
+    parser.add_argument('--max-delay-ms', type=float, default=MAX_DELAY * 1000, help='Time a request waits for others to batch with')
+    args = parser.parse_args(argv)
+
+    service = PredictionService(args.workers, args.max_batch_rows, args.max_delay_ms / 1000)
+    web.run_app(create_app(service), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,92 @@
 import numpy as np
+import pandas as pd
+
+def difference(values, last_value, out=None):
+    """
+    Subtract the last known value from every element and clip negative differences to 0.
+
+    Parameters:
+    values (array-like): The user's input, a scalar or an N-element array.
+    last_value (float or array-like): The last known value, broadcastable against values.
+    out (np.ndarray, optional): Array to write the result into. It may be values itself.
+
+    Returns:
+    np.ndarray: The clipped differences, computed element-wise in one pass.
+    """
+    out = np.subtract(values, last_value, out=out, dtype=np.float64)
+    return np.maximum(out, 0, out=out)
+
+def log_difference(values, last_value, out=None):
+    """
+    Subtract log1p of the last known value from log1p of every element and clip negative results to 0.
+
+    Parameters:
+    values (array-like): The user's input, a scalar or an N-element array.
+    last_value (float or array-like): The last known value, broadcastable against values.
+    out (np.ndarray, optional): Array to write the result into. It may be values itself.
+
+    Returns:
+    np.ndarray: The clipped log differences, computed element-wise in one pass.
+    """
+    out = np.log1p(values, out=out, dtype=np.float64)
+    out -= np.log1p(last_value)
+    return np.maximum(out, 0, out=out)
+
+def transform_matrix(matrix, differenced_columns=(), differenced_values=(), log_columns=(), log_values=(), out=None):
+    """
+    Apply differencing and log-differencing to selected columns of an N-row feature matrix.
+
+    Parameters:
+    matrix (np.ndarray): A 2D array with one row per sample. It is not modified unless passed as out.
+    differenced_columns (sequence of int): Column positions to difference.
+    differenced_values (array-like): Last known values for those columns, shape (k,) or (N, k).
+    log_columns (sequence of int): Column positions to log-difference.
+    log_values (array-like): Last known values for those columns, shape (k,) or (N, k).
+    out (np.ndarray, optional): A float64 array of the same shape to write the result into.
+
+    Returns:
+    np.ndarray: The transformed float64 matrix.
+    """
+    if out is None:
+        out = np.array(matrix, dtype=np.float64)
+    elif out is not matrix:
+        np.copyto(out, matrix)
+
+    differenced_columns = np.asarray(differenced_columns, dtype=np.intp)
+    log_columns = np.asarray(log_columns, dtype=np.intp)
+    if differenced_columns.size:
+        out[:, differenced_columns] = difference(out[:, differenced_columns], differenced_values)
+    if log_columns.size:
+        out[:, log_columns] = log_difference(out[:, log_columns], log_values)
+    return out
+
+def _last_known_values(dataframe_with_last_known_value):
+    if isinstance(dataframe_with_last_known_value, pd.DataFrame):
+        return dataframe_with_last_known_value.iloc[0]
+    return pd.Series(dataframe_with_last_known_value)
 
 def preprocess_differencing(main_dataframe, dataframe_with_last_known_value):
     """
     Preprocess the main dataframe by subtracting values from the dataframe_with_last_known_value.
 
     Parameters:
-    main_dataframe (pd.DataFrame): The main dataframe containing 14 features. 
-                                   This dataframe is expected to have one row of user input.
-    dataframe_with_last_known_value (pd.DataFrame): The dataframe containing 6 features and their known values.
-                                                    This dataframe is expected to have one row with known values.
+    main_dataframe (pd.DataFrame): The main dataframe containing 14 features, one row per sample.
+                                   It is left unmodified.
+    dataframe_with_last_known_value (pd.DataFrame or dict): The known values of the differenced features.
+                                                            A dataframe is expected to have one row with known values.
 
     Returns:
-    pd.DataFrame: A new dataframe with the same structure as the main_dataframe, 
-                  where the values of the 6 matching features have been subtracted 
-                  by their corresponding values in the dataframe_with_last_known_value.
+    pd.DataFrame: A new dataframe with the same structure as the main_dataframe,
+                  where the values of the matching features have been subtracted
+                  by their corresponding known values, row by row, with negative differences set to 0.
     """
-    common_columns = main_dataframe.columns.intersection(dataframe_with_last_known_value.columns)
+    last_known_values = _last_known_values(dataframe_with_last_known_value)
+    common_columns = main_dataframe.columns.intersection(last_known_values.index)
 
-    for column in common_columns:
-        main_dataframe[column] = main_dataframe[column] - dataframe_with_last_known_value[column]
-        if main_dataframe[column].iloc[0] < 0:
-            main_dataframe[column] = 0
-        
-    return main_dataframe
+    return main_dataframe.assign(**{
+        column: difference(main_dataframe[column].to_numpy(), last_known_values[column])
+        for column in common_columns
+    })
 
 def preprocess_log(user_input, last_value):
     '''
@@ -30,20 +94,17 @@ def preprocess_log(user_input, last_value):
     the last known value from the user's input.
 
     Parameters:
-    user_input (pd.Series): The series containing one value which is user's input.
-                            The series expects to have only one value.
-    last_value (pd.Series): The series containing one value which is the last known value.
-                            The series expects to have only one value.
+    user_input (pd.Series or array-like): The user's input, one value per sample.
+    last_value (float or pd.Series): The last known value. A series is expected to have only one value.
 
     Returns:
-    pd.Series: A new series with one preprocessed value.
+    pd.Series or np.ndarray: The preprocessed values, with negative results set to 0.
+                             A series is returned when user_input is a series.
     '''
+    if isinstance(last_value, pd.Series):
+        last_value = last_value.iloc[0]
 
-    log_user_input = np.log1p(user_input)
-    log_last_value = np.log1p(last_value)
-
-    transformed_value = log_user_input - log_last_value
-    if transformed_value.iloc[0] < 0:
-        transformed_value = 0
-
-    return transformed_value
\ No newline at end of file
+    transformed_value = log_difference(np.asarray(user_input), last_value)
+    if isinstance(user_input, pd.Series):
+        return pd.Series(transformed_value, index=user_input.index, name=user_input.name)
+    return transformed_value
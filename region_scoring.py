@@ -0,0 +1,117 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from feature_pipeline import get_pipeline
+from model_registry import ModelRegistry, get_model
+
+REGION_COLUMN = 'region'
+# Below this many rows in total, scoring in this process beats shipping the rows to workers.
+MIN_PARALLEL_ROWS = 50_000
+# Large regions are split into tasks of at most this many rows to balance the workers.
+TASK_ROWS = 250_000
+
+_worker_registry = None
+
+
+def _init_worker():
+    global _worker_registry
+    _worker_registry = ModelRegistry(nthread=1)
+
+def _score_in_worker(name, region, matrix):
+    model = _worker_registry.get(name, region)
+    return model.predict(get_pipeline(name, region).transform(matrix))
+
+def _score_here(name, region, matrix):
+    return get_model(name, region).predict(get_pipeline(name, region).transform(matrix))
+
+
+class RegionScorer:
+    """
+    Score inputs from many regions, each with its region's model and baselines,
+    fanning the regions out over a pool of worker processes.
+
+    Workers are started with 'spawn', since forking a process that has already run
+    XGBoost's OpenMP threads can deadlock, and each loads the models it needs once.
+    Small jobs are scored in this process instead.
+
+    Parameters:
+    processes (int, optional): Number of worker processes, the number of cores by default.
+    min_parallel_rows (int): Total rows from which the pool is used.
+    """
+
+    def __init__(self, processes=None, min_parallel_rows=MIN_PARALLEL_ROWS):
+        self.processes = processes or os.cpu_count() or 1
+        self.min_parallel_rows = min_parallel_rows
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'),
+                                                         initializer=_init_worker)
+        return self._executor
+
+    def score(self, name, inputs):
+        """
+        Parameters:
+        name (str): The model name.
+        inputs (dict): Region to its raw feature rows, in any form FeaturePipeline.to_matrix accepts.
+
+        Returns:
+        dict: Region to an array with one prediction per input row.
+        """
+        matrices = {region: get_pipeline(name, region).to_matrix(data) for region, data in inputs.items()}
+        rows = sum(len(matrix) for matrix in matrices.values())
+        if self.processes == 1 or rows < self.min_parallel_rows:
+            return {region: _score_here(name, region, matrix) for region, matrix in matrices.items()}
+
+        pool = self._pool()
+        futures = {
+            region: [pool.submit(_score_in_worker, name, region, chunk)
+                     for chunk in np.array_split(matrix, max(1, -(-len(matrix) // TASK_ROWS)))]
+            for region, matrix in matrices.items()
+        }
+        return {region: np.concatenate([future.result() for future in tasks]) for region, tasks in futures.items()}
+
+    def score_frame(self, name, dataframe, region_column=REGION_COLUMN):
+        """
+        Score a frame with a region column, each row with its own region's model.
+
+        Returns:
+        np.ndarray: One prediction per input row, in input order.
+        """
+        if dataframe[region_column].isna().any():
+            raise ValueError(f"Every row needs a '{region_column}'")
+        groups = dataframe.groupby(region_column, sort=False).indices
+        scored = self.score(name, {region: dataframe.iloc[positions] for region, positions in groups.items()})
+        predictions = np.empty(len(dataframe), dtype=np.float32)
+        for region, positions in groups.items():
+            predictions[positions] = scored[region]
+        return predictions
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+def get_scorer():
+    """
+    Return the process-wide RegionScorer; its worker pool starts on first parallel use.
+    """
+    global _scorer
+    if _scorer is None:
+        with _scorer_lock:
+            if _scorer is None:
+                _scorer = RegionScorer()
+    return _scorer
+
+def score_regions(name, inputs):
+    return get_scorer().score(name, inputs)
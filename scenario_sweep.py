@@ -0,0 +1,54 @@
+import numpy as np
+from data_store import DEFAULT_REGION
+from feature_pipeline import get_pipeline
+from model_registry import get_model
+
+MAX_GRID_POINTS = 1_000_000
+
+
+def build_grid(pipeline, base_inputs, sweeps):
+    """
+    Build the raw input matrix for every combination of the swept feature values.
+
+    Parameters:
+    pipeline (FeaturePipeline): The model's feature pipeline.
+    base_inputs (dict): Raw values for every feature; swept features are overridden.
+    sweeps (dict): Feature name to a 1D array of values, one or two entries.
+
+    Returns:
+    np.ndarray: An (N, 14) raw matrix, N being the product of the sweep lengths, with
+                the first swept feature varying slowest.
+    """
+    axes = [np.asarray(values, dtype=pipeline.dtype) for values in sweeps.values()]
+    size = int(np.prod([len(values) for values in axes]))
+    if size > MAX_GRID_POINTS:
+        raise ValueError(f"The sweep has {size:,} points, more than the limit of {MAX_GRID_POINTS:,}")
+
+    base = pipeline.to_matrix({feature: base_inputs[feature] for feature in pipeline.features})
+    matrix = np.repeat(base, size, axis=0)
+    mesh = np.meshgrid(*axes, indexing='ij')
+    for feature, values in zip(sweeps, mesh):
+        matrix[:, pipeline.features.index(feature)] = values.ravel()
+    return matrix
+
+def run_sweep(name, sweeps, base_inputs=None, region=DEFAULT_REGION):
+    """
+    Score a one or two dimensional grid of scenarios with a single batched prediction.
+
+    Parameters:
+    name (str): The model name.
+    sweeps (dict): Feature name to a 1D array of values, one or two entries.
+    base_inputs (dict, optional): Raw values for the features that are not swept,
+                                  the pipeline's defaults when omitted.
+    region (str): The region whose model and baselines are used.
+
+    Returns:
+    np.ndarray: The predictions shaped like the grid, one axis per swept feature.
+    """
+    if not 1 <= len(sweeps) <= 2:
+        raise ValueError("Select one or two features to sweep")
+    pipeline = get_pipeline(name, region)
+    base_inputs = {**pipeline.default_inputs(), **(base_inputs or {})}
+    matrix = pipeline.transform(build_grid(pipeline, base_inputs, sweeps))
+    predictions = get_model(name, region).predict(matrix)
+    return predictions.reshape([len(values) for values in sweeps.values()])
@@ -0,0 +1,21 @@
+import pandas as pd
+import streamlit as st
+from instrumentation import metrics
+
+def main(spans):
+    with st.expander("Diagnostics", expanded=True):
+        cols = st.columns(2)
+
+        with cols[0]:
+            st.write("**This rerun**")
+            rerun = pd.DataFrame(spans, columns=['stage', 'seconds'])
+            st.dataframe(rerun.round(4), use_container_width=True, hide_index=True)
+
+        with cols[1]:
+            st.write("**All sessions since start**")
+            stages, counters = metrics.snapshot()
+            st.dataframe(pd.DataFrame(stages, columns=['stage', 'count', 'total', 'mean', 'p50', 'p95', 'max']).round(4),
+                         use_container_width=True, hide_index=True)
+            st.write(counters)
+
+        st.download_button("Prometheus metrics", metrics.prometheus(), file_name='metrics.txt', mime='text/plain')
@@ -1,56 +1,81 @@
 import warnings
-import pandas as pd
+from functools import partial
 import streamlit as st
 import plotly.express as px
+import plotly.graph_objects as go
+from data_store import get_store
+from aggregates import get_aggregates
+from downsampling import downsample_line, downsample_scatter
+from export import EXPORT_FORMATS, export_data
+from st_pages.region_select import region_select
 
 warnings.filterwarnings('ignore')
 
 
-file_path = './assets/data/preprocessed_data_updated.csv'
-
-@st.cache_data
-def load_data(file_path):
-    df = pd.read_csv(file_path)
-    return df
-
-def cases_by_stringency_index(df):
-    fig = px.box(df, x='stringency_index', y='imputed_total_cases',
+def load_data(region):
+    return get_store(region).frame().reset_index()
+
+def box_figure(box, x, y, title):
+    """
+    Draw one box per group from precomputed statistics, with the outliers as points.
+    """
+    stats, outliers = box
+    outliers_by_group = dict(tuple(outliers.groupby(x)[y]))
+    colors = px.colors.qualitative.Plotly
+    fig = go.Figure()
+    for position, (group, row) in enumerate(stats.iterrows()):
+        color = colors[position % len(colors)]
+        fig.add_trace(go.Box(
+            x=[group], q1=[row['q1']], median=[row['median']], q3=[row['q3']],
+            lowerfence=[row['lowerfence']], upperfence=[row['upperfence']],
+            name=str(group), legendgroup=str(group), marker_color=color, boxpoints=False,
+        ))
+        if group in outliers_by_group:
+            points = outliers_by_group[group]
+            fig.add_trace(go.Scatter(
+                x=[group] * len(points), y=points, mode='markers', name=str(group),
+                legendgroup=str(group), marker_color=color, showlegend=False,
+            ))
+    fig.update_layout(title=title, height=360, boxmode='overlay', xaxis_title=x, yaxis_title=y, legend_title_text=x)
+    return fig
+
+def cases_by_stringency_index(aggregates):
+    fig = box_figure(aggregates.box('stringency_index', 'imputed_total_cases'),
+                'stringency_index', 'imputed_total_cases',
                 title='Cases by Stringency Index',
-                color='stringency_index',
-                height=360,
                 )
     fig.update_layout(
         margin=dict(l=0, r=0, t=50, b=0),
     )
     st.plotly_chart(fig)
 
-def total_deaths_by_stringency_index(df):
-    fig = px.box(df, x='stringency_index', y='imputed_total_deaths',
-                title='Total deaths by Stringency Index',
-                color='stringency_index', height=360)
+def total_deaths_by_stringency_index(aggregates):
+    fig = box_figure(aggregates.box('stringency_index', 'imputed_total_deaths'),
+                'stringency_index', 'imputed_total_deaths',
+                title='Total deaths by Stringency Index')
     fig.update_layout(
         margin=dict(l=0, r=0, t=50, b=0)
     )
     st.plotly_chart(fig)
 
-def deaths_by_reproduction_rate(df):
-    fig = px.box(df, x='reproduction_rate', y='imputed_total_deaths',
-                title='Deaths by Reproduction Rate',
-                color='reproduction_rate', height=360)
+def deaths_by_reproduction_rate(aggregates):
+    fig = box_figure(aggregates.box('reproduction_rate', 'imputed_total_deaths'),
+                'reproduction_rate', 'imputed_total_deaths',
+                title='Deaths by Reproduction Rate')
     fig.update_layout(
         margin=dict(l=0, r=0, t=50, b=0)
     )
     st.plotly_chart(fig)
 
 # Create a function to plot cases analysis
-def plot_cases_analysis(df):
-    plot_df_cases = df.groupby(['Unnamed: 0'])['imputed_total_cases'].sum().reset_index()
+def plot_cases_analysis(aggregates):
+    plot_df_cases = aggregates.daily_totals()[['imputed_total_cases']].reset_index()
     fig = px.line(
-        plot_df_cases,
-        x='Unnamed: 0',
+        downsample_line(plot_df_cases, 'date', 'imputed_total_cases'),
+        x='date',
         y='imputed_total_cases',
         title='Total Cases Over Time',
-        labels={'Unnamed: 0': 'Date', 'imputed_total_cases': 'Total Cases'}, height=360
+        labels={'date': 'Date', 'imputed_total_cases': 'Total Cases'}, height=360
     )
     fig.update_xaxes(tickfont=dict(size=14))
     fig.update_yaxes(title_text='Total Cases', title_font=dict(size=14))
@@ -59,14 +84,14 @@ def plot_cases_analysis(df):
     )
     st.plotly_chart(fig, use_container_width=True)
 
-def plot_deaths_analysis(df):
-    plot_df_deaths = df.groupby(['Unnamed: 0'])['imputed_total_deaths'].sum().reset_index()
+def plot_deaths_analysis(aggregates):
+    plot_df_deaths = aggregates.daily_totals()[['imputed_total_deaths']].reset_index()
     fig = px.line(
-        plot_df_deaths,
-        x='Unnamed: 0',
+        downsample_line(plot_df_deaths, 'date', 'imputed_total_deaths'),
+        x='date',
         y='imputed_total_deaths',
         title='Total Deaths Over Time',
-        labels={'Unnamed: 0': 'Date', 'imputed_total_deaths': 'Total Deaths'}, height=360
+        labels={'date': 'Date', 'imputed_total_deaths': 'Total Deaths'}, height=360
     )
     fig.update_xaxes(tickfont=dict(size=14))
     fig.update_yaxes(title_text='Total Deaths', title_font=dict(size=16))
@@ -77,14 +102,14 @@ def plot_deaths_analysis(df):
     )
     st.plotly_chart(fig, use_container_width=True)
 
-def plot_vaccinations_analysis(df):
-    plot_df_vaccinations = df.groupby(['Unnamed: 0'])['totalVaccinations'].sum().reset_index()
+def plot_vaccinations_analysis(aggregates):
+    plot_df_vaccinations = aggregates.daily_totals()[['totalVaccinations']].reset_index()
     fig = px.line(
-        plot_df_vaccinations,
-        x='Unnamed: 0',
+        downsample_line(plot_df_vaccinations, 'date', 'totalVaccinations'),
+        x='date',
         y='totalVaccinations',
         title='Total Vaccinations Over Time',
-        labels={'Unnamed: 0': 'Date', 'totalVaccinations': 'Total Vaccinations'}, height=360
+        labels={'date': 'Date', 'totalVaccinations': 'Total Vaccinations'}, height=360
     )
     fig.update_xaxes(tickfont=dict(size=14))
     fig.update_yaxes(title_text='Total Vaccinations', title_font=dict(size=16))
@@ -97,18 +122,22 @@ def plot_vaccinations_analysis(df):
 
 
 def main(eda):
-    df = load_data(file_path)
-    
-    cols_0, _, cols_1 = eda.columns([0.8,1,0.4])
+    cols_0, region_area, cols_1 = eda.columns([0.8,1,0.4])
     with cols_0:
         st.write("<h3>📈 Exploratory Data Analysis</h3>", unsafe_allow_html=True)
         st.write("Explore the relationship between various COVID-19 metrics by selecting from the sidebar")
+
+    region = region_select(region_area, 'eda_region')
+    df = load_data(region)
+    aggregates = get_aggregates(region)
         
     with cols_1:
-        df = load_data(file_path)
         st.write("<br>"*2, unsafe_allow_html=True)
-        csv = df.to_csv(index=False).encode('utf-8')
-        st.download_button('Download Data', data=csv, file_name="covid_data.csv", mime="text/csv", use_container_width=True, key='eda_download')
+        with st.popover('Download Data', use_container_width=True):
+            for fmt, export_format in EXPORT_FORMATS.items():
+                st.download_button(export_format['label'], data=partial(export_data, fmt, region=region),
+                                   file_name=export_format['file_name'], mime=export_format['mime'],
+                                   on_click='ignore', use_container_width=True, key=f'eda_download_{fmt}')
         
     cols = eda.columns(3)
     with cols[0]:
@@ -116,13 +145,13 @@ def main(eda):
             page = st.selectbox('Select Analysis Type', ['Cases Analysis', 'Deaths Analysis', 'Vaccinations Analysis'])
             
             if page == 'Cases Analysis':
-                plot_cases_analysis(df)
+                plot_cases_analysis(aggregates)
 
             elif page == 'Deaths Analysis':
-                plot_deaths_analysis(df)
+                plot_deaths_analysis(aggregates)
 
             elif page == 'Vaccinations Analysis':
-                plot_vaccinations_analysis(df)
+                plot_vaccinations_analysis(aggregates)
 
     with cols[1]:
         with st.container(border=True):
@@ -133,7 +162,7 @@ def main(eda):
                 cat_filter = st.selectbox("Select Categorical Column", ['stringency_index', 'reproduction_rate', 'rfh', 'r3h'])
             
             if num_filter is not None:
-                fig = px.scatter(df, x=num_filter, y='totalVaccinations', color=cat_filter, size=num_filter, height=360)
+                fig = px.scatter(downsample_scatter(df, num_filter, 'totalVaccinations'), x=num_filter, y='totalVaccinations', color=cat_filter, size=num_filter, height=360)
                 fig.update_layout(
                     margin=dict(l=0, r=0, t=50, b=0),
                 )
@@ -144,11 +173,11 @@ def main(eda):
             plot_choice = st.selectbox("Select a Plot", ["Cases by Stringency Index","Total Deaths Distribution by Stringency index", "Deaths Distribution by Reproduction Rate"])
                 
             if plot_choice == "Cases by Stringency Index":
-                cases_by_stringency_index(df)
+                cases_by_stringency_index(aggregates)
             elif plot_choice == "Deaths Distribution by Reproduction Rate":
-                deaths_by_reproduction_rate(df)
+                deaths_by_reproduction_rate(aggregates)
             else:
-                total_deaths_by_stringency_index(df)
+                total_deaths_by_stringency_index(aggregates)
 
     eda.write("<br>", unsafe_allow_html=True)
     eda.dataframe(df)
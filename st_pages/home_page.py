@@ -1,5 +1,27 @@
+import requests
 import streamlit as st
-from streamlit_lottie import st_lottie
+from lazy_loading import load_attr
+
+ANIMATION_URL = "https://lottie.host/00c554d8-f352-4ed4-85c7-5c4e2610c092/TGx4z8xXUg.json"
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_animation(url):
+    """
+    Fetch the Lottie JSON once per process instead of on every rerun. Failures raise,
+    so they are not cached and the next rerun tries again.
+    """
+    response = requests.get(url, timeout=3)
+    response.raise_for_status()
+    return response.json()
+
+def load_animation(url):
+    """
+    Returns None when the animation cannot be fetched, so a slow network never blocks the page.
+    """
+    try:
+        return fetch_animation(url)
+    except (requests.RequestException, ValueError):
+        return None
 
 def main(home):
     cols = home.columns(2)
@@ -15,7 +37,9 @@ def main(home):
         
     with cols[1]:
         st.write("<br>"*3, unsafe_allow_html=True)
-        st_lottie("https://lottie.host/00c554d8-f352-4ed4-85c7-5c4e2610c092/TGx4z8xXUg.json")
+        animation = load_animation(ANIMATION_URL)
+        if animation is not None:
+            load_attr('streamlit_lottie', 'st_lottie')(animation)
 
     home.markdown(f"""
     {'<br>'*9}
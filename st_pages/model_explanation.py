@@ -0,0 +1,48 @@
+import numpy as np
+import streamlit as st
+import plotly.express as px
+from data_store import DEFAULT_REGION
+from explanations import BIAS_COLUMN, explain, global_importance
+
+
+def contribution_chart(contributions):
+    contributions = contributions.drop(BIAS_COLUMN)
+    contributions = contributions[contributions.abs().sort_values().index]
+    fig = px.bar(x=contributions.values, y=contributions.index, orientation='h',
+                 color=contributions.values > 0, color_discrete_map={True: '#EF553B', False: '#636EFA'},
+                 labels={'x': 'Contribution', 'y': ''}, title="This prediction")
+    fig.update_layout(showlegend=False)
+    return fig
+
+def importance_chart(importance):
+    importance = importance.sort_values()
+    fig = px.bar(x=importance.values, y=importance.index, orientation='h',
+                 labels={'x': 'Mean absolute contribution', 'y': ''}, title="Across the history")
+    return fig
+
+def explained_prediction(name, input_features, region=DEFAULT_REGION):
+    """
+    Score one input row with the served model and attribute it to the features in the
+    same call: the prediction is the sum of the contributions, as with
+    batch_predict.py --explain, so the chart explains the very prediction shown.
+
+    Returns:
+    tuple: The prediction and the pd.Series of contributions, the bias included.
+    """
+    contributions = explain(name, input_features, region).iloc[0]
+    return float(contributions.to_numpy().sum(dtype=np.float32)), contributions
+
+def explanation_section(mod, name, contributions, region=DEFAULT_REGION):
+    """
+    Show what a prediction of the served model is made of, next to what the model relies
+    on overall: each feature's contribution to this prediction, and its mean absolute
+    contribution over the region's history.
+    """
+    local, overall = mod.columns(2)
+    with local:
+        st.plotly_chart(contribution_chart(contributions))
+        st.caption(f"Each bar is what a feature adds to or takes from the average prediction, "
+                   f"{contributions[BIAS_COLUMN]:.3f}; together they make up the prediction above, "
+                   f"{contributions.to_numpy().sum(dtype=np.float32):.3f}.")
+    with overall:
+        st.plotly_chart(importance_chart(global_importance(name, region)))
@@ -1,15 +1,7 @@
-import pickle
 import streamlit as st
-from st_pages.model_total_case_prediction import total_case_prediction_page
-from st_pages.model_total_death_prediction import total_death_prediction_page
-
-model_path = './assets/model/xgb_model_total_imputed_cases.pkl'
-
-@st.cache_resource
-def load_model(path):
-    with open(path, 'rb') as file:
-        model = pickle.load(file)
-    return model
+from lazy_loading import load_attr
+from feature_pipeline import baselines_as_of
+from st_pages.region_select import region_select
 
 def preprocess(main_dataframe, dataframe_with_last_known_value):
     """
@@ -43,13 +35,21 @@ def main(mod):
         st.write("<h3>😷 COVID-19 Case Prediction</h3>", unsafe_allow_html=True)
         st.caption("""Enter the required features to predict the total imputed COVID-19 cases. Please provide the values for the following features:""")
         
+    with cols[1]:
+        st.write("<br>", unsafe_allow_html=True)
+        mode = st.radio("Mode:", ["Single Prediction", "Scenario Sweep"], horizontal=True)
+        region = region_select(st, 'model_region')
+
     with cols[2]:
         st.write("<br>", unsafe_allow_html=True)
         options = st.selectbox("Select a Prediction Model:", ["Total Death Prediction", "Total Case Prediction"])
         
-    mod.caption("""🛈 The minimum values for 'fullyVaccinated', 'partiallyVaccinated', 'totalVaccinations' and 'totalTests' are the last known values as on 21st April 2024.""")
+    mod.caption(f"""🛈 The minimum values for 'fullyVaccinated', 'partiallyVaccinated', 'totalVaccinations' and 'totalTests' are the last known values as on {baselines_as_of(region):%d %B %Y}.""")
         
-    if options == "Total Death Prediction":
-        total_death_prediction_page(mod)
+    # The sub-pages pull in XGBoost, so only the one shown is imported.
+    if mode == "Scenario Sweep":
+        load_attr('st_pages.model_scenario_sweep', 'scenario_sweep_page')(mod, 'deaths' if options == "Total Death Prediction" else 'cases', region)
+    elif options == "Total Death Prediction":
+        load_attr('st_pages.model_total_death_prediction', 'total_death_prediction_page')(mod, region)
     elif options == "Total Case Prediction":
-        total_case_prediction_page(mod)
\ No newline at end of file
+        load_attr('st_pages.model_total_case_prediction', 'total_case_prediction_page')(mod, region)
\ No newline at end of file
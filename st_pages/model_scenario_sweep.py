@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+import plotly.express as px
+from data_store import DEFAULT_REGION
+from feature_pipeline import get_pipeline
+from scenario_sweep import MAX_GRID_POINTS, run_sweep
+
+def sweep_range_inputs(container, feature, default, key):
+    cols = container.columns(3)
+    with cols[0]:
+        start = st.number_input(f"**{feature}** from", value=float(default), key=f"{key}_{feature}_start")
+    with cols[1]:
+        stop = st.number_input(f"**{feature}** to", value=float(default) * 1.5 + 100, key=f"{key}_{feature}_stop")
+    with cols[2]:
+        steps = st.number_input(f"**{feature}** steps", min_value=2, max_value=MAX_GRID_POINTS, value=300, step=1, key=f"{key}_{feature}_steps")
+    return np.linspace(start, stop, int(steps))
+
+def scenario_sweep_page(mod, model_name, region=DEFAULT_REGION):
+    pipeline = get_pipeline(model_name, region)
+    defaults = pipeline.default_inputs()
+    key = f"sweep_{model_name}"
+
+    mod.caption("Pick one or two features and their ranges. Every other feature is held at its minimum value, "
+                "and the whole grid is scored in a single batched prediction.")
+    features = mod.multiselect("Features to sweep", pipeline.features, default=['stringency_index'],
+                               max_selections=2, key=f"{key}_features")
+
+    sweeps = {feature: sweep_range_inputs(mod, feature, defaults[feature], key) for feature in features}
+    points = int(np.prod([len(values) for values in sweeps.values()])) if sweeps else 0
+    run = mod.button(f"Run Sweep ({points:,} scenarios)", disabled=not sweeps, use_container_width=True, key=f"{key}_run")
+    mod.divider()
+
+    if run:
+        try:
+            predictions = run_sweep(model_name, sweeps, region=region)
+        except Exception as e:
+            mod.error(f"An error occurred: {e}")
+            return
+
+        if len(sweeps) == 1:
+            (feature, values), = sweeps.items()
+            fig = px.line(pd.DataFrame({feature: values, pipeline.label: predictions}), x=feature, y=pipeline.label,
+                          title=f"Predicted {pipeline.label} by {feature}")
+        else:
+            (x_feature, x_values), (y_feature, y_values) = sweeps.items()
+            fig = px.imshow(predictions.T, x=x_values, y=y_values, origin='lower', aspect='auto',
+                            labels={'x': x_feature, 'y': y_feature, 'color': pipeline.label},
+                            title=f"Predicted {pipeline.label} by {x_feature} and {y_feature}")
+        fig.update_layout(height=420, margin=dict(l=0, r=0, t=50, b=0))
+        mod.plotly_chart(fig, use_container_width=True)
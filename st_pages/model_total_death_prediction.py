@@ -1,21 +1,22 @@
-import pickle
-import pandas as pd
 import streamlit as st
-from preprocessing import preprocess_differencing, preprocess_log
+from lazy_loading import load_attr
+from data_store import DEFAULT_REGION
+from feature_pipeline import get_pipeline
+from prediction_cache import predict as predict_cached
+from model_registry import get_model
+from prediction_intervals import format_interval, has_intervals, interval_bounds
 
-def load_model_total_death():
-    with open('assets/model/xgb_model_total_deaths.pkl', 'rb') as file:
-        model = pickle.load(file)
-    return model
 
-def total_death_prediction_page(mod):
+def total_death_prediction_page(mod, region=DEFAULT_REGION):
+    pipeline = get_pipeline('deaths', region)
+    defaults = pipeline.default_inputs()
     col1, col2, col3 = mod.columns(3)
 
     with col1:
         imputed_active_cases = st.number_input("**imputed_active_cases**", min_value=0.0, help="Estimate of the number of active COVID-19 cases at a given time")
-        fullyVaccinated = st.number_input("**fullyVaccinated**", min_value=9327654, value=9327654, step=1, help="Number of individuals who have completed the full vaccination regimen for COVID-19")
+        fullyVaccinated = st.number_input("**fullyVaccinated**", min_value=int(defaults['fullyVaccinated']), value=int(defaults['fullyVaccinated']), step=1, help="Number of individuals who have completed the full vaccination regimen for COVID-19")
         new_vaccinations_smoothed = st.number_input("**new_vaccinations_smoothed**", min_value=0.0, help="New COVID-19 vaccination doses administered (7-day smoothed)")
-        partiallyVaccinated = st.number_input("**partiallyVaccinated**", min_value=4663827, value=4663827, step=1, help="Number of individuals who have received at least one dose of a COVID-19 vaccine but have not yet completed the full vaccination regimen.")
+        partiallyVaccinated = st.number_input("**partiallyVaccinated**", min_value=int(defaults['partiallyVaccinated']), value=int(defaults['partiallyVaccinated']), step=1, help="Number of individuals who have received at least one dose of a COVID-19 vaccine but have not yet completed the full vaccination regimen.")
         stringency_index = st.number_input("**stringency_index**", min_value=0.0, step=0.001, max_value=100.0, help="Government response composite measure based on 9 response indicators including school/workplace closures,and travel bans, value from 0 to 100(100=strictest)")
 
     with col2:  
@@ -27,51 +28,49 @@ def total_death_prediction_page(mod):
 
     with col3:
         test24hours = st.number_input("**test24hours**", min_value=0, help="Number of tests conducted in the last 24 hours")
-        totalVaccinations = st.number_input("**totalVaccinations**", min_value=9982068, value=9982068, step=1, help="Total number of COVID-19 vaccination doses administered")
+        totalVaccinations = st.number_input("**totalVaccinations**", min_value=int(defaults['totalVaccinations']), value=int(defaults['totalVaccinations']), step=1, help="Total number of COVID-19 vaccination doses administered")
         month = st.number_input("**month**", min_value=1, max_value=12, help="The month in the year with January=1, December=12")
         day_of_week = st.number_input("**day_of_week**", min_value=0, max_value=6, help="The day of the week with Monday=0, Sunday=6")
         
         st.write("<br>", unsafe_allow_html=True)
         predict = st.button("Predict", use_container_width=True)
+        show_interval = st.toggle("Prediction interval", disabled=not has_intervals(pipeline.name, region),
+                                  help="A range around the prediction, from the model's errors on past days. "
+                                       "Needs the intervals, calibrated with `python prediction_intervals.py calibrate`")
+        show_explanation = st.toggle("Explain prediction", help="How much each feature adds to or takes from the prediction")
         
-    input_df = pd.DataFrame({
-            'imputed_active_cases': [imputed_active_cases],
-            'fullyVaccinated': [fullyVaccinated],
-            'new_vaccinations_smoothed': [new_vaccinations_smoothed],
-            'partiallyVaccinated': [partiallyVaccinated],
-            'stringency_index' : [stringency_index],
-            'test24hours': [test24hours],
-            'totalVaccinations': [totalVaccinations],
-            'total_tests_per_thousand': [total_tests_per_thousand],
-            'vaccinated24hours': [vaccinated24hours],
-            'positive_rate': [positive_rate],
-            'rfh': [rfh],
-            'r3h': [r3h],
-            'day_of_week': [day_of_week],
-            'month':[month],
-            })
+    input_features = {
+            'imputed_active_cases': imputed_active_cases,
+            'fullyVaccinated': fullyVaccinated,
+            'new_vaccinations_smoothed': new_vaccinations_smoothed,
+            'partiallyVaccinated': partiallyVaccinated,
+            'stringency_index' : stringency_index,
+            'test24hours': test24hours,
+            'totalVaccinations': totalVaccinations,
+            'total_tests_per_thousand': total_tests_per_thousand,
+            'vaccinated24hours': vaccinated24hours,
+            'positive_rate': positive_rate,
+            'rfh': rfh,
+            'r3h': r3h,
+            'day_of_week': day_of_week,
+            'month': month,
+            }
 
     mod.markdown("🛈 The non-stationary features are differenced to make the data stationary.")
     mod.divider()
 
-    differenced_features = {
-        'fullyVaccinated': 9327654, 'partiallyVaccinated': 4663827, 'stringency_index': 13.89,
-        'totalVaccinations': 9982068
-    }
-
-    log_feature = {'total_tests_per_thousand': 180}
-    log_series = pd.Series(log_feature)
-    differencing_data = pd.DataFrame([differenced_features])
-    preprocessed_data = preprocess_differencing(input_df, differencing_data)
-
-    for feature in log_feature.keys():
-        preprocessed_data[feature] = preprocess_log(preprocessed_data[feature], log_series[feature])
-
     if predict:
         try:
-            model = load_model_total_death()
-            prediction = model.predict(preprocessed_data)
-            st.toast(f"Predicted Total Deaths: {prediction[0]: .3f}", icon="💡")
-            mod.success(f"Predicted Total Deaths: {prediction[0]: .3f}")
+            if show_explanation:
+                explained_prediction = load_attr('st_pages.model_explanation', 'explained_prediction')
+                prediction, contributions = explained_prediction(pipeline.name, input_features, region)
+            else:
+                prediction = predict_cached(pipeline.name, input_features, region=region)[0]
+            st.toast(f"Predicted Total Deaths: {prediction: .3f}", icon="💡")
+            mod.success(f"Predicted Total Deaths: {prediction: .3f}")
+            if show_interval:
+                mod.info(format_interval(interval_bounds(get_model(pipeline.name, region), [prediction], region)))
+            if show_explanation:
+                load_attr('st_pages.model_explanation', 'explanation_section')(mod, pipeline.name, contributions, region)
         except Exception as e:
             mod.error(f"An error occurred: {e}")
\ No newline at end of file
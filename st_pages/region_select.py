@@ -0,0 +1,10 @@
+from data_store import DEFAULT_REGION, list_regions
+
+def region_select(container, key):
+    """
+    Region picker for a page, only shown when there is more than one region.
+    """
+    regions = list_regions()
+    if len(regions) == 1:
+        return DEFAULT_REGION
+    return container.selectbox("Region", regions, format_func=lambda region: region.replace('_', ' ').title(), key=key)
@@ -0,0 +1,97 @@
+import os
+import numpy as np
+import pytest
+import xgboost as xgb
+from compact_model import CompactForest, parity_inputs
+from feature_pipeline import PIPELINES, get_pipeline, random_inputs
+from model_registry import ModelRegistry, load_booster, resolve_model_path
+
+
+def train_booster(depth=4, rounds=30, seed=0, **params):
+    rng = np.random.default_rng(seed)
+    matrix = rng.normal(size=(500, 6))
+    matrix[rng.random(matrix.shape) < 0.1] = np.nan
+    targets = np.nansum(matrix[:, :3], axis=1) + rng.normal(size=500)
+    params = dict({'objective': 'reg:squarederror', 'max_depth': depth, 'seed': seed}, **params)
+    return xgb.train(params, xgb.DMatrix(matrix, targets), rounds)
+
+def boundary_inputs(booster, forest, rows=200, seed=0):
+    """
+    Rows with each split's feature set exactly on, just below and just above its
+    threshold, or missing, so that every comparison is exercised at its edge.
+    """
+    rng = np.random.default_rng(seed)
+    splits = np.flatnonzero(forest.left != np.arange(len(forest.left)))
+    matrix = rng.normal(size=(rows * 4, booster.num_features())).astype(np.float32)
+    picks = rng.choice(splits, size=rows * 4)
+    thresholds = forest.threshold[picks]
+    values = np.concatenate([thresholds[:rows],
+                             np.nextafter(thresholds[rows:2 * rows], np.float32(-np.inf)),
+                             np.nextafter(thresholds[2 * rows:3 * rows], np.float32(np.inf)),
+                             np.full(rows, np.nan, dtype=np.float32)])
+    matrix[np.arange(rows * 4), forest.feature[picks]] = values
+    return matrix
+
+def assert_parity(booster, matrix):
+    forest = CompactForest.from_booster(booster)
+    np.testing.assert_array_equal(forest.predict(matrix), booster.inplace_predict(matrix))
+
+
+@pytest.mark.parametrize('depth', [1, 3, 6])
+def test_random_inputs(depth):
+    booster = train_booster(depth)
+    rng = np.random.default_rng(1)
+    matrix = rng.normal(size=(1000, 6)) * 2
+    matrix[rng.random(matrix.shape) < 0.2] = np.nan
+    assert_parity(booster, matrix)
+
+@pytest.mark.parametrize('depth', [1, 3, 6])
+def test_boundary_inputs(depth):
+    booster = train_booster(depth)
+    assert_parity(booster, boundary_inputs(booster, CompactForest.from_booster(booster)))
+
+def test_edge_cases():
+    booster = train_booster()
+    assert_parity(booster, np.full((3, 6), np.nan))
+    assert_parity(booster, np.array([[np.inf] * 6, [-np.inf] * 6, [0.0] * 6]))
+    assert CompactForest.from_booster(booster).predict(np.empty((0, 6))).shape == (0,)
+
+def test_save_and_load(tmp_path):
+    booster = train_booster()
+    forest = CompactForest.from_booster(booster)
+    forest.save(tmp_path / 'model.npz')
+    loaded = CompactForest.load(tmp_path / 'model.npz')
+    assert loaded.source == forest.source
+    matrix = np.random.default_rng(2).normal(size=(100, 6))
+    np.testing.assert_array_equal(loaded.predict(matrix), booster.inplace_predict(matrix))
+
+def test_unsupported_objective():
+    with pytest.raises(ValueError):
+        CompactForest.from_booster(train_booster(objective='reg:quantileerror', quantile_alpha=0.5))
+
+@pytest.mark.parametrize('name', list(PIPELINES))
+def test_served_models(name):
+    path = resolve_model_path(get_pipeline(name).model_path)
+    if not os.path.exists(path):
+        pytest.skip(f'No model file for {name}')
+    booster = load_booster(path)
+    pipeline = get_pipeline(name)
+    assert_parity(booster, parity_inputs(name, 2000))
+    assert_parity(booster, pipeline.transform(random_inputs(pipeline, 2000, seed=1)))
+    assert_parity(booster, boundary_inputs(booster, CompactForest.from_booster(booster)))
+
+def test_registry_ignores_stale_export(tmp_path):
+    path = str(tmp_path / 'model.ubj')
+    booster = train_booster()
+    booster.save_model(path)
+    CompactForest.from_booster(booster).save(tmp_path / 'model.npz')
+    registry = ModelRegistry()
+    assert registry.get_file('test', path).compact is not None
+
+    replacement = train_booster(seed=1)
+    replacement.save_model(path)
+    os.utime(path, ns=(0, 0))
+    model = registry.get_file('test', path)
+    assert model.compact is None
+    matrix = np.random.default_rng(3).normal(size=(2, 6))
+    np.testing.assert_array_equal(model.predict(matrix), replacement.inplace_predict(matrix))
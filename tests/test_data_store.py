@@ -0,0 +1,62 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import data_store
+from data_store import (MANIFEST_FILE, SNAPSHOT_DIR, SNAPSHOT_GRACE_SECONDS, _remove_old_snapshots, read_snapshot,
+                        write_snapshot)
+
+
+def sample_frame():
+    index = pd.DatetimeIndex(pd.date_range('2024-01-01', periods=5), name='date')
+    return pd.DataFrame({'a': np.arange(5.0), 'b': np.arange(5)}, index=index)
+
+def test_snapshot_round_trip(tmp_path):
+    df = sample_frame()
+    write_snapshot(df, str(tmp_path / 'snapshot'))
+    index, columns = read_snapshot(str(tmp_path / 'snapshot'))
+    pd.testing.assert_index_equal(index, df.index)
+    np.testing.assert_array_equal(columns['a'], df['a'])
+
+def test_read_snapshot_removed_while_opening(tmp_path):
+    path = str(tmp_path / 'snapshot')
+    write_snapshot(sample_frame(), path)
+    os.remove(os.path.join(path, 'index.npy'))
+    assert read_snapshot(path) is None
+
+def test_remove_old_snapshots(tmp_path):
+    revisions = [hashlib.sha256(str(n).encode()).hexdigest() for n in range(4)]
+    with open(tmp_path / MANIFEST_FILE, 'w') as file:
+        json.dump({'revisions': revisions}, file)
+    for revision in revisions:
+        write_snapshot(sample_frame(), str(tmp_path / SNAPSHOT_DIR / revision[:16]))
+    snapshots = tmp_path / SNAPSHOT_DIR
+
+    # A process on the oldest revision keeps its own and the two newest snapshots.
+    _remove_old_snapshots(str(tmp_path), revisions[0][:16])
+    assert len(os.listdir(snapshots)) == 4
+    _remove_old_snapshots(str(tmp_path), revisions[0][:16], now=os.stat(snapshots).st_mtime + SNAPSHOT_GRACE_SECONDS + 1)
+    assert sorted(os.listdir(snapshots)) == sorted(revision[:16] for revision in [revisions[0]] + revisions[2:])
+
+def test_store_stamp_matches_rebuilt_manifest(tmp_path, monkeypatch):
+    csv_path = str(tmp_path / 'data.csv')
+    sample_frame().to_csv(csv_path)
+    monkeypatch.setattr(data_store, 'read_source_csv', lambda path: pd.read_csv(path, index_col=0, parse_dates=True))
+    store = data_store.DataStore(str(tmp_path / 'store'), csv_path)
+    assert store.manifest_stamp == data_store._manifest_stamp(store.store_path)
+
+def test_concurrent_ensure_store_builds_once(tmp_path, monkeypatch):
+    csv_path = str(tmp_path / 'data.csv')
+    sample_frame().to_csv(csv_path)
+    monkeypatch.setattr(data_store, 'read_source_csv', lambda path: pd.read_csv(path, index_col=0, parse_dates=True))
+    builds = []
+    build_store = data_store.build_store
+    monkeypatch.setattr(data_store, 'build_store', lambda *args: builds.append(args) or build_store(*args))
+    store_path = str(tmp_path / 'store')
+    with ThreadPoolExecutor(8) as pool:
+        manifests = list(pool.map(lambda _: data_store.ensure_store(csv_path, store_path), range(8)))
+    assert len(builds) == 1
+    assert {manifest['revisions'][-1] for manifest in manifests} == {manifests[0]['revisions'][-1]}
+    assert not [name for name in os.listdir(store_path) if name.endswith('.tmp')]
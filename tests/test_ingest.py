@@ -0,0 +1,64 @@
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+import data_store
+from data_store import DATA_PATH, get_store
+from ingest import ingest
+from time_series import CUMULATIVE_METRICS, TimeSeriesIndex, get_time_series
+
+REGION = 'testland'
+
+
+@pytest.fixture
+def region(tmp_path, monkeypatch):
+    (tmp_path / REGION).mkdir()
+    shutil.copy(DATA_PATH, tmp_path / REGION / 'data.csv')
+    monkeypatch.setattr(data_store, 'REGIONS_PATH', str(tmp_path))
+    return REGION
+
+def write_drop(path, records):
+    with open(path, 'w') as file:
+        json.dump(records, file)
+    return str(path)
+
+
+def test_partial_drop_keeps_totals(region, tmp_path):
+    before = get_time_series(region=region)
+    last_date = get_store(region).last_date
+    last_row = get_store(region).frame(CUMULATIVE_METRICS).iloc[-1]
+    drop = write_drop(tmp_path / 'drop.json', [{
+        'date': (last_date + pd.Timedelta(days=1)).date().isoformat(),
+        'imputed_total_cases': float(last_row['imputed_total_cases']) + 10,
+        'totalVaccinations': float(last_row['totalVaccinations']) + 10,
+        'stringency_index': 20.0,
+    }])
+
+    assert ingest([drop], region)[0]['appended'] == 1
+    store = get_store(region)
+    appended = store.frame(CUMULATIVE_METRICS).iloc[-1]
+    # Totals the drop left out are carried forward from the last day.
+    for metric in ['imputed_total_deaths', 'totalTests', 'imputed_total_recoveries']:
+        assert appended[metric] == last_row[metric]
+
+    expected = store.frame(CUMULATIVE_METRICS).max()
+    series = get_time_series(region=region)
+    assert series is not before
+    for lo, hi in [(0, len(series)), (len(series) - 1, len(series)), (len(series) - 7, len(series))]:
+        totals = series.totals(lo, hi)
+        window = store.frame(CUMULATIVE_METRICS).iloc[lo:hi].max()
+        assert totals == pytest.approx(window.to_dict())
+    assert series.totals(0, len(series)) == pytest.approx(expected.to_dict())
+
+
+def test_range_max_skips_missing_values():
+    dates = pd.date_range('2024-01-01', periods=9)
+    values = np.array([1, 5, np.nan, 3, np.nan, np.nan, 9, 2, np.nan])
+    series = TimeSeriesIndex(dates[:5], {'total': values[:5]}).extend(dates[5:], {'total': values[5:]})
+    for lo in range(len(values)):
+        for hi in range(lo + 1, len(values) + 1):
+            window = values[lo:hi]
+            expected = np.nan if np.isnan(window).all() else np.nanmax(window)
+            assert series.range_max('total', lo, hi) == pytest.approx(expected, nan_ok=True)
+    assert TimeSeriesIndex(dates, {'total': values}).totals(0, 9) == {'total': 9.0}
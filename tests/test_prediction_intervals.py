@@ -0,0 +1,38 @@
+import json
+import numpy as np
+import pytest
+import prediction_intervals
+from model_registry import ModelRegistry
+from prediction_intervals import interval_bounds, load_calibration, served_params
+from test_compact_model import train_booster
+
+
+@pytest.fixture
+def model(tmp_path, monkeypatch):
+    path = str(tmp_path / 'model.ubj')
+    train_booster().save_model(path)
+    monkeypatch.setattr(prediction_intervals, 'interval_path', lambda name, region: str(tmp_path / 'intervals.json'))
+    return ModelRegistry().get_file('test', path)
+
+def write_calibration(model, offsets, version=None):
+    with open(prediction_intervals.interval_path(model.name, None), 'w') as file:
+        json.dump({'model_version': version or model.version, 'quantiles': [0.05, 0.95], 'offsets': offsets}, file)
+
+def test_interval_contains_prediction(model):
+    write_calibration(model, [-5.0, 3.0])
+    predictions = np.array([-1.0, 2.0, 10.0])
+    intervals = interval_bounds(model, predictions)
+    assert list(intervals.columns) == ['q5', 'q95']
+    assert (intervals['q5'] <= predictions).all() and (predictions <= intervals['q95']).all()
+    np.testing.assert_array_equal(intervals['q5'], [-1.0, 0.0, 5.0])
+
+def test_calibration_of_another_model_is_ignored(model):
+    write_calibration(model, [-5.0, 3.0], version='another')
+    assert load_calibration(model) is None
+    with pytest.raises(FileNotFoundError):
+        interval_bounds(model, [1.0])
+
+def test_served_params():
+    params = served_params(train_booster(depth=3, eta=0.2, subsample=0.8))
+    assert params['max_depth'] == 3 and params['subsample'] == pytest.approx(0.8)
+    assert params['eta'] == pytest.approx(0.2) and params['objective'] == 'reg:squarederror'
@@ -0,0 +1,14 @@
+import numpy as np
+import pytest
+from training import GAP, early_stopping_split, time_series_folds
+
+
+@pytest.mark.parametrize('scheme', ['blocked', 'expanding'])
+def test_early_stopping_split(scheme):
+    for train, validation in time_series_folds(1000, 10, scheme):
+        fit, stopping = early_stopping_split(train, validation)
+        assert len(stopping) and len(fit)
+        assert set(fit) | set(stopping) <= set(train)
+        assert not set(stopping) & set(validation)
+        # No day fitted on is within GAP days of an early-stopping day.
+        assert np.abs(fit[:, None] - stopping[None, :]).min() > GAP
@@ -0,0 +1,140 @@
+import threading
+import numpy as np
+import pandas as pd
+from data_store import DEFAULT_REGION, get_store
+from instrumentation import timed
+
+CUMULATIVE_METRICS = [
+    'imputed_total_cases', 'imputed_total_deaths', 'totalTests', 'totalVaccinations', 'imputed_total_recoveries'
+]
+
+
+def build_max_table(values):
+    """
+    Build a sparse table of running maxima: level k holds the maximum of every window
+    of 2**k consecutive values, so any range maximum is the larger of two lookups.
+    Missing values are skipped; a window holds NaN only when all its values are missing.
+
+    Parameters:
+    values (np.ndarray): A 1D array of metric values in date order.
+
+    Returns:
+    list of np.ndarray: The table levels, level 0 being the values themselves.
+    """
+    levels = [np.asarray(values, dtype=np.float64)]
+    width = 1
+    while 2 * width <= len(values):
+        previous = levels[-1]
+        levels.append(np.fmax(previous[:-width], previous[width:]))
+        width *= 2
+    return levels
+
+def extend_max_table(levels, values):
+    """
+    Append values to a sparse table built by build_max_table, computing only the
+    windows that end in the new values.
+
+    Returns:
+    list of np.ndarray: The levels of the table over the old and new values.
+    """
+    extended = [np.concatenate([levels[0], np.asarray(values, dtype=np.float64)])]
+    size = len(extended[0])
+    width = 1
+    while 2 * width <= size:
+        previous = extended[-1]
+        old = levels[len(extended)] if len(extended) < len(levels) else previous[:0]
+        start = len(old)
+        new = np.fmax(previous[start:size - 2 * width + 1], previous[start + width:size - width + 1])
+        extended.append(np.concatenate([old, new]))
+        width *= 2
+    return extended
+
+
+class TimeSeriesIndex:
+    """
+    A sorted date index with O(log n) range lookup and O(1) range maxima for the
+    cumulative metrics.
+
+    Parameters:
+    dates (array-like): The dates of the rows, sorted ascending.
+    metrics (dict): Metric name to a 1D array of values aligned with dates.
+    """
+
+    def __init__(self, dates, metrics):
+        self.dates = np.asarray(dates, dtype='datetime64[ns]')
+        if len(self.dates) > 1 and np.any(self.dates[1:] < self.dates[:-1]):
+            raise ValueError("dates must be sorted ascending")
+        self._tables = {name: build_max_table(values) for name, values in metrics.items()}
+
+    def __len__(self):
+        return len(self.dates)
+
+    def extend(self, dates, metrics):
+        """
+        Return a new index with rows appended, dated after the last row, reusing this
+        index's tables instead of rebuilding them.
+        """
+        dates = np.asarray(dates, dtype='datetime64[ns]')
+        if len(dates) and len(self.dates) and dates[0] <= self.dates[-1]:
+            raise ValueError("Appended dates must follow the last date")
+        series = TimeSeriesIndex.__new__(TimeSeriesIndex)
+        series.dates = np.concatenate([self.dates, dates])
+        if len(series.dates) > 1 and np.any(series.dates[1:] < series.dates[:-1]):
+            raise ValueError("dates must be sorted ascending")
+        series._tables = {name: extend_max_table(levels, metrics[name]) for name, levels in self._tables.items()}
+        return series
+
+    @property
+    def start(self):
+        return pd.Timestamp(self.dates[0])
+
+    @property
+    def end(self):
+        return pd.Timestamp(self.dates[-1])
+
+    def locate(self, start_date, end_date):
+        """
+        Find the positional slice [lo, hi) of the rows dated from start_date to end_date inclusive.
+        """
+        lo = np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start_date), 'ns'), side='left')
+        hi = np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end_date), 'ns'), side='right')
+        return int(lo), int(max(lo, hi))
+
+    def range_max(self, name, lo, hi):
+        """
+        Return the maximum of a metric over rows [lo, hi), ignoring missing values,
+        or NaN for an empty range or one without any value.
+        """
+        if hi <= lo:
+            return np.nan
+        levels = self._tables[name]
+        k = (hi - lo).bit_length() - 1
+        level = levels[k]
+        return float(np.fmax(level[lo], level[hi - (1 << k)]))
+
+    def totals(self, lo, hi):
+        return {name: self.range_max(name, lo, hi) for name in self._tables}
+
+
+_series = {}
+_series_lock = threading.Lock()
+
+def get_time_series(metrics=CUMULATIVE_METRICS, region=DEFAULT_REGION):
+    """
+    Return the process-wide TimeSeriesIndex of a region for its current store version.
+    Rows appended to the store since the last call extend the previous index.
+    """
+    store = get_store(region)
+    with _series_lock:
+        current = _series.get(region)
+        if current is None or current[0] != store.content_hash:
+            appended = store.rows_since(current[0], metrics) if current is not None else None
+            if appended is not None:
+                with timed('time_series_extend'):
+                    series = current[1].extend(appended.index, {name: appended[name].to_numpy() for name in metrics})
+            else:
+                with timed('time_series_build'):
+                    frame = store.frame(metrics)
+                    series = TimeSeriesIndex(frame.index, {name: frame[name].to_numpy() for name in metrics})
+            _series[region] = current = (store.content_hash, series)
+        return current[1]
@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import xgboost as xgb
+from compact_model import CompactForest, compact_path
+from data_store import DEFAULT_REGION, get_store, list_regions
+from feature_pipeline import PIPELINES, get_pipeline
+from model_registry import REGION_MODELS_PATH, native_path
+
+# Every training run is kept here, as <region>/<model>/<version>/ with the model and its metrics.
+VERSIONS_PATH = 'assets/model/versions'
+MODEL_FILE = 'model.ubj'
+METRICS_FILE = 'metrics.json'
+
+BASE_PARAMS = {'objective': 'reg:squarederror', 'tree_method': 'hist', 'seed': 0}
+SEARCH_SPACE = {
+    'max_depth': [2, 3, 4, 6],
+    'eta': [0.03, 0.1, 0.3],
+    'subsample': [0.7, 0.85, 1.0],
+    'colsample_bytree': [0.7, 0.85, 1.0],
+    'min_child_weight': [1, 3, 10],
+    'lambda': [0.1, 1, 10],
+}
+CANDIDATES = 24
+FOLDS = 10
+# Days left out on both sides of a validation block, so that training never sees its neighbours.
+GAP = 7
+MAX_ROUNDS = 2000
+EARLY_STOPPING_ROUNDS = 50
+
+
+def training_data(name, region=DEFAULT_REGION):
+    """
+    Returns:
+    tuple: The preprocessed daily history of a region as (matrix, targets), rows without a target dropped.
+    """
+    pipeline = get_pipeline(name, region)
+    store = get_store(region)
+    history = store.frame([feature for feature in pipeline.features if feature in store.columns] + [pipeline.target_column])
+    matrix = pipeline.transform_history(history)
+    targets = history[pipeline.target_column].to_numpy(dtype=np.float64)[1:]
+    known = ~np.isnan(targets)
+    return matrix[known], targets[known]
+
+def time_series_folds(rows, folds=FOLDS, scheme='blocked', gap=GAP):
+    """
+    Split the days into cross-validation folds that respect their order.
+
+    'blocked' cuts the history into folds consecutive blocks and validates on each block
+    after training on all others, minus gap days on either side of it. 'expanding' cuts
+    it into folds + 1 blocks and trains on every block before the validated one, which
+    measures forecasting instead: the targets are cumulative totals, which trees cannot
+    extrapolate beyond the training range, so it favours models that stop very early.
+
+    Returns:
+    list of tuple: The (train positions, validation positions) of each fold.
+    """
+    positions = np.arange(rows)
+    if scheme == 'expanding':
+        bounds = np.linspace(0, rows, folds + 2).astype(int)
+        return [(positions[:bounds[fold]], positions[bounds[fold]:bounds[fold + 1]]) for fold in range(1, folds + 1)]
+    if scheme != 'blocked':
+        raise ValueError(f"Unknown scheme '{scheme}', expected 'blocked' or 'expanding'")
+    bounds = np.linspace(0, rows, folds + 1).astype(int)
+    return [(positions[(positions < start - gap) | (positions >= end + gap)], positions[start:end])
+            for start, end in zip(bounds[:-1], bounds[1:])]
+
+def early_stopping_split(train, validation, gap=GAP):
+    """
+    Carve the early-stopping days out of a fold's training positions, so that the number
+    of rounds is never chosen on the validated days: the block of training days just
+    before the validated ones (after them for the first block), as long as the validation
+    block but at most half the training days, with gap days left out between it and the
+    days fitted on.
+
+    Returns:
+    tuple: The (fit positions, early-stopping positions).
+    """
+    size = min(len(validation), len(train) // 2)
+    before = train[train < validation[0]]
+    if len(before) > size + gap:
+        stopping = before[-size:]
+    else:
+        stopping = train[train > validation[-1]][:size]
+    fit = train[(train < stopping[0] - gap) | (train > stopping[-1] + gap)]
+    return fit, stopping
+
+def sample_candidates(count=CANDIDATES, seed=0):
+    """
+    Draw distinct parameter combinations from SEARCH_SPACE, the same ones for the same seed.
+    """
+    grid = list(itertools.product(*SEARCH_SPACE.values()))
+    picks = np.random.default_rng(seed).choice(len(grid), size=min(count, len(grid)), replace=False)
+    return [dict(zip(SEARCH_SPACE, grid[pick])) for pick in picks]
+
+
+_worker_data = None
+
+def _init_worker(matrix, targets):
+    global _worker_data
+    _worker_data = matrix, targets
+
+def _fit_fold(params, train, validation, nthread):
+    matrix, targets = _worker_data
+    fit, stopping = early_stopping_split(train, validation)
+    fit_matrix = xgb.DMatrix(matrix[fit], targets[fit])
+    stopping_matrix = xgb.DMatrix(matrix[stopping], targets[stopping])
+    booster = xgb.train(dict(BASE_PARAMS, **params, nthread=nthread), fit_matrix, MAX_ROUNDS,
+                        evals=[(stopping_matrix, 'stopping')], early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+                        verbose_eval=False)
+    # The validated days are scored only now, by the model as early-stopped.
+    errors = booster.predict(xgb.DMatrix(matrix[validation]), iteration_range=(0, booster.best_iteration + 1)) - targets[validation]
+    return {'rmse': float(np.sqrt(np.mean(errors ** 2))), 'mae': float(np.mean(np.abs(errors))),
+            'rounds': booster.best_iteration + 1}
+
+
+def search(matrix, targets, candidates, folds, processes=None):
+    """
+    Cross-validate every candidate on every fold, each (candidate, fold) pair being one
+    task for a pool of worker processes. The cores are split between the workers, each
+    fitting with nthread XGBoost threads; with a single process everything runs here.
+
+    Returns:
+    list of dict: One result per candidate, best (lowest mean RMSE) first, with the
+                  per-fold scores and the median of the early-stopped rounds.
+    """
+    cores = os.cpu_count() or 1
+    processes = min(processes or cores, len(candidates) * len(folds))
+    nthread = max(1, cores // processes)
+    tasks = [(params, train, validation, nthread) for params in candidates for train, validation in folds]
+    if processes == 1:
+        _init_worker(matrix, targets)
+        scores = [_fit_fold(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker,
+                                 initargs=(matrix, targets)) as pool:
+            scores = list(pool.map(_fit_fold, *zip(*tasks)))
+
+    results = []
+    for position, params in enumerate(candidates):
+        fold_scores = scores[position * len(folds):(position + 1) * len(folds)]
+        results.append({
+            'params': params,
+            'rmse': float(np.mean([score['rmse'] for score in fold_scores])),
+            'mae': float(np.mean([score['mae'] for score in fold_scores])),
+            'rounds': int(np.median([score['rounds'] for score in fold_scores])),
+            'folds': fold_scores,
+        })
+    return sorted(results, key=lambda result: result['rmse'])
+
+
+def train_model(name, region=DEFAULT_REGION, candidates=CANDIDATES, folds=FOLDS, scheme='blocked', processes=None, seed=0):
+    """
+    Search hyperparameters with time-series cross-validation on a region's history, refit
+    the best candidate on all of it and save the model with its metrics as a new version.
+
+    Returns:
+    tuple: The version directory and the metrics written to it.
+    """
+    started = time.perf_counter()
+    pipeline = get_pipeline(name, region)
+    matrix, targets = training_data(name, region)
+    splits = time_series_folds(len(targets), folds, scheme)
+    results = search(matrix, targets, sample_candidates(candidates, seed), splits, processes)
+    best = results[0]
+
+    booster = xgb.train(dict(BASE_PARAMS, **best['params'], nthread=os.cpu_count() or 1),
+                        xgb.DMatrix(matrix, targets, feature_names=pipeline.features), best['rounds'])
+    raw = booster.save_raw('ubj')
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{hashlib.sha1(raw).hexdigest()[:8]}"
+    path = os.path.join(VERSIONS_PATH, region, name, version)
+    os.makedirs(path)
+    with open(os.path.join(path, MODEL_FILE), 'wb') as file:
+        file.write(raw)
+
+    metrics = {
+        'model': name,
+        'region': region,
+        'version': version,
+        'target': pipeline.target_column,
+        'features': pipeline.features,
+        'data_revision': get_store(region).content_hash,
+        'rows': len(targets),
+        'params': dict(BASE_PARAMS, **best['params']),
+        'rounds': best['rounds'],
+        'cv': {
+            'scheme': scheme,
+            'folds': [[int(validation[0]), int(validation[-1]) + 1] for _, validation in splits],
+            'rmse': best['rmse'],
+            'mae': best['mae'],
+            'per_fold': best['folds'],
+        },
+        'search': [{key: result[key] for key in ('params', 'rmse', 'mae', 'rounds')} for result in results],
+        'seed': seed,
+        'xgboost': xgb.__version__,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+    with open(os.path.join(path, METRICS_FILE), 'w') as file:
+        json.dump(metrics, file, indent=2)
+    return path, metrics
+
+def serving_path(name, region=DEFAULT_REGION):
+    """
+    The UBJSON file the registry serves name from in a region, preferred over the pickle.
+    """
+    path = native_path(get_pipeline(name).model_path, '.ubj')
+    if region != DEFAULT_REGION:
+        path = os.path.join(REGION_MODELS_PATH, region, os.path.basename(path))
+    return path
+
+def promote(version_path):
+    """
+    Serve a trained version: write it where the registry looks, with its compact export,
+    each file replaced atomically. Running apps pick it up on their next prediction.
+
+    Returns:
+    str: The path now served from.
+    """
+    with open(os.path.join(version_path, METRICS_FILE)) as file:
+        metrics = json.load(file)
+    booster = xgb.Booster(model_file=os.path.join(version_path, MODEL_FILE))
+    path = serving_path(metrics['model'], metrics['region'])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # The compact export goes first: the registry reloads when the model file changes.
+    CompactForest.from_booster(booster).save(compact_path(path) + '.tmp')
+    os.replace(compact_path(path) + '.tmp', compact_path(path))
+    tmp = os.path.splitext(path)[0] + '.tmp.ubj'
+    booster.save_model(tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Retrain the models with time-series cross-validated hyperparameter search.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train = subparsers.add_parser('train', help='Train new model versions')
+    train.add_argument('--model', action='append', choices=list(PIPELINES), help='Model to train, repeatable (default: all)')
+    train.add_argument('--region', default=DEFAULT_REGION, choices=list_regions(), help='Region whose history is trained on')
+    train.add_argument('--candidates', type=int, default=CANDIDATES, help='Hyperparameter combinations tried')
+    train.add_argument('--folds', type=int, default=FOLDS, help='Time-series cross-validation folds')
+    train.add_argument('--scheme', default='blocked', choices=['blocked', 'expanding'], help='How folds are cut, see time_series_folds')
+    train.add_argument('--processes', type=int, default=None, help='Worker processes, the number of cores by default')
+    train.add_argument('--seed', type=int, default=0, help='Seed of the candidate sampling')
+    train.add_argument('--promote', action='store_true', help='Serve the new versions right away')
+    promote_parser = subparsers.add_parser('promote', help='Serve a trained version')
+    promote_parser.add_argument('version', help=f'A version directory under {VERSIONS_PATH}')
+    args = parser.parse_args(argv)
+
+    if args.command == 'promote':
+        print(f"Serving {args.version} from {promote(args.version)}")
+        return 0
+
+    for name in args.model or list(PIPELINES):
+        path, metrics = train_model(name, args.region, args.candidates, args.folds, args.scheme, args.processes, args.seed)
+        print(f"{name}: wrote {path} in {metrics['seconds']} s, cross-validated RMSE {metrics['cv']['rmse']:.3f}, "
+              f"MAE {metrics['cv']['mae']:.3f}, {metrics['rounds']} rounds of {metrics['params']}")
+        if args.promote:
+            print(f"{name}: serving from {promote(path)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())